@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""A module for benchmarking the personal data helpers.
+"""
+import io
+import re
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+from itertools import product
+from typing import Callable, Dict, List
+from bulk_redact import redact_csv
+from encrypt_password import (
+    hash_password, hash_passwords, is_valid, verify_many,
+)
+from filtered_logger import (
+    filter_datum, patterns, PII_FIELDS, RedactingFormatter,
+    get_redaction_engine,
+)
+
+
+SAMPLE_LINE = (
+    "name=Marlene Wood; email=hwestiii@att.net; phone=(473) 401-4253; "
+    "ssn=261-72-6780; password=K5?BMNv; "
+    "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea; "
+    "last_login=2019-11-14 06:14:24; user_agent=Mozilla/5.0;"
+)
+SAMPLE_ROW = dict(
+    part.split('=', 1) for part in SAMPLE_LINE.rstrip(';').split('; ')
+)
+
+
+def uncached_filter_datum(
+        fields: List[str], redaction: str, message: str, separator: str,
+        ) -> str:
+    """Filters a log line, rebuilding the regex on every call.
+    """
+    extract, replace = (patterns["extract"], patterns["replace"])
+    return re.sub(extract(fields, separator), replace(redaction), message)
+
+
+def lines_per_sec(redact: Callable[[List[str]], object], lines: List[str],
+                  repeat: int = 5) -> float:
+    """Measures the best throughput of a redaction function in lines/sec.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        redact(lines)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def bench_redaction(n_lines: int = 100000) -> None:
+    """Compares the redaction engine against the uncached function.
+    """
+    lines = [SAMPLE_LINE] * n_lines
+    redaction, separator = (RedactingFormatter.REDACTION,
+                            RedactingFormatter.SEPARATOR)
+    engine = get_redaction_engine(PII_FIELDS, redaction, separator)
+    candidates = {
+        'uncached filter_datum': lambda xs: [
+            uncached_filter_datum(PII_FIELDS, redaction, x, separator)
+            for x in xs
+        ],
+        'RedactionEngine.redact': lambda xs: [engine.redact(x) for x in xs],
+        'RedactionEngine.redact_many': engine.redact_many,
+    }
+    for name, redact in candidates.items():
+        print("{:<30} {:>12,.0f} lines/sec".format(
+            name, lines_per_sec(redact, lines)))
+
+
+def bench_rows(n_rows: int = 100000) -> None:
+    """Compares redacting structured rows against building then scrubbing.
+    """
+    rows = [SAMPLE_ROW] * n_rows
+    engine = get_redaction_engine(PII_FIELDS, RedactingFormatter.REDACTION,
+                                  RedactingFormatter.SEPARATOR)
+
+    def build_and_scrub(xs):
+        for row in xs:
+            msg = '{};'.format('; '.join(
+                '{}={}'.format(k, v) for k, v in row.items()))
+            engine.redact(msg)
+
+    candidates = {
+        'build line + regex': build_and_scrub,
+        'RedactionEngine.redact_row': lambda xs: [
+            engine.redact_row(x) for x in xs
+        ],
+    }
+    for name, redact in candidates.items():
+        print("{:<30} {:>12,.0f} rows/sec".format(
+            name, lines_per_sec(redact, rows)))
+
+
+def csv_rewrite(lines: List[str], fields: List[str], redaction: str) -> str:
+    """Redacts the PII columns of CSV lines with csv.reader and csv.writer.
+    """
+    output = io.StringIO(lines[0])
+    output.seek(0, io.SEEK_END)
+    reader = csv.reader(lines)
+    writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    header = next(reader)
+    indexes = [i for i, column in enumerate(header) if column in fields]
+    for row in reader:
+        for i in indexes:
+            row[i] = redaction
+        writer.writerow(row)
+    return output.getvalue()
+
+
+def filter_rows(lines: List[str], fields: List[str], redaction: str) -> list:
+    """Redacts CSV lines with filter_datum, each row rendered as key=value;
+    like the rows logged by filtered_logger.main.
+    """
+    reader = csv.reader(lines)
+    header = next(reader)
+    return [
+        filter_datum(fields, redaction, ''.join(
+            "{}={};".format(k, v) for k, v in zip(header, row)), ';')
+        for row in reader
+    ]
+
+
+def bench_csv(n_rows: int = 100000) -> None:
+    """Compares column-oriented CSV redaction against a csv module rewrite
+    and filter_datum over key=value; rows, all redacting the PII columns.
+    """
+    with open("user_data.csv", 'r', newline='') as f:
+        header, *rows = f.readlines()
+    lines = [header] + [rows[i % len(rows)] for i in range(n_rows)]
+    text = ''.join(lines)
+    redaction = RedactingFormatter.REDACTION
+    output = io.StringIO()
+    redact_csv(io.StringIO(text), output, PII_FIELDS, redaction)
+    assert output.getvalue() == csv_rewrite(lines, PII_FIELDS, redaction)
+    candidates = {
+        'filter_datum key=value;': lambda xs: filter_rows(
+            xs, PII_FIELDS, redaction,
+        ),
+        'csv.reader/csv.writer': lambda xs: csv_rewrite(
+            xs, PII_FIELDS, redaction,
+        ),
+        'redact_csv': lambda xs: redact_csv(
+            io.StringIO(text), io.StringIO(), PII_FIELDS, redaction,
+        ),
+    }
+    for name, redact in candidates.items():
+        print("{:<30} {:>12,.0f} rows/sec".format(
+            name, lines_per_sec(redact, lines)))
+
+
+def bench_hashing(n_passwords: int = 64, rounds: int = 10) -> None:
+    """Measures hashes/sec of hash_passwords for growing worker counts.
+    """
+    passwords = ["password{}".format(i) for i in range(n_passwords)]
+    start = time.perf_counter()
+    hashes = [hash_password(p, rounds) for p in passwords]
+    print("{:<30} {:>12,.1f} hashes/sec".format(
+        'hash_password loop', n_passwords / (time.perf_counter() - start)))
+    for workers in (1, 2, 4, 8):
+        for processes in (False, True):
+            start = time.perf_counter()
+            list(hash_passwords(passwords, workers, rounds, processes))
+            print("{:<30} {:>12,.1f} hashes/sec".format(
+                'hash_passwords {} {}'.format(
+                    workers, 'processes' if processes else 'threads'),
+                n_passwords / (time.perf_counter() - start)))
+    start = time.perf_counter()
+    assert all(verify_many(zip(hashes, passwords), 4))
+    print("{:<30} {:>12,.1f} checks/sec".format(
+        'verify_many 4 threads', n_passwords / (time.perf_counter() - start)))
+
+
+def make_message(n_fields: int, length: int, pii_fraction: float) -> str:
+    """Builds a log line of about the given length in which a fraction of
+    the fields are PII fields.
+    """
+    n_pii = round(n_fields * pii_fraction)
+    names = [PII_FIELDS[i % len(PII_FIELDS)] for i in range(n_pii)]
+    names += ["field{}".format(i) for i in range(n_fields - n_pii)]
+    value_length = max(1, length // n_fields - 12)
+    return ''.join('{}={};'.format(name, 'x' * value_length)
+                   for name in names)
+
+
+def measure(func: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """Times each call of a function and summarizes the latencies.
+    """
+    timer = time.perf_counter
+    latencies = []
+    for _ in range(iterations):
+        start = timer()
+        func()
+        latencies.append(timer() - start)
+    latencies.sort()
+
+    def percentile(q: float) -> float:
+        """Picks the latency at a given quantile.
+        """
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    return {
+        "iterations": iterations,
+        "ops_per_sec": iterations / sum(latencies),
+        "p50_us": percentile(0.50) * 1e6,
+        "p90_us": percentile(0.90) * 1e6,
+        "p99_us": percentile(0.99) * 1e6,
+    }
+
+
+def redaction_scenarios(iterations: int) -> List[dict]:
+    """Benchmarks filter_datum and RedactingFormatter.format.
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    redaction, separator = (formatter.REDACTION, formatter.SEPARATOR)
+    results = []
+    grid = product((5, 20), (100, 1000), (0.0, 0.5, 1.0))
+    for n_fields, length, pii_fraction in grid:
+        message = make_message(n_fields, length, pii_fraction)
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   message, None, None)
+        params = {"fields": n_fields, "length": len(message),
+                  "pii_fraction": pii_fraction}
+        cases = {
+            "filter_datum": lambda: filter_datum(
+                PII_FIELDS, redaction, message, separator),
+            "RedactingFormatter.format": lambda: formatter.format(record),
+        }
+        for name, func in cases.items():
+            results.append(dict(name=name, params=params,
+                                **measure(func, iterations)))
+    return results
+
+
+def password_scenarios(iterations: int, costs: List[int]) -> List[dict]:
+    """Benchmarks hash_password and is_valid.
+    """
+    results = []
+    for cost in costs:
+        hashed = hash_password("password", cost)
+        cases = {
+            "hash_password": lambda: hash_password("password", cost),
+            "is_valid": lambda: is_valid(hashed, "password"),
+        }
+        for name, func in cases.items():
+            results.append(dict(name=name, params={"cost": cost},
+                                **measure(func, iterations)))
+    return results
+
+
+def git_revision() -> str:
+    """Finds the commit being benchmarked, if any.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(iterations: int, hash_iterations: int,
+              costs: List[int]) -> dict:
+    """Runs every scenario and collects machine-readable results.
+    """
+    return {
+        "commit": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": redaction_scenarios(iterations) +
+        password_scenarios(hash_iterations, costs),
+    }
+
+
+def main():
+    """Runs the benchmark suite and writes its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSON results file (default: stdout)")
+    parser.add_argument("-n", "--iterations", type=int, default=10000)
+    parser.add_argument("--hash-iterations", type=int, default=10)
+    parser.add_argument("--costs", default="4,8,10,12",
+                        help="comma separated bcrypt costs")
+    parser.add_argument("--compare", type=int, metavar="N",
+                        help="print the throughput comparisons over N lines")
+    args = parser.parse_args()
+    if args.compare:
+        bench_redaction(args.compare)
+        bench_rows(args.compare)
+        bench_csv(args.compare)
+        bench_hashing()
+        return
+    costs = [int(cost) for cost in args.costs.split(',')]
+    report = run_suite(args.iterations, args.hash_iterations, costs)
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""A module for redacting large log files on every core.
+"""
+import os
+import sys
+import mmap
+import time
+import argparse
+from multiprocessing import Pool
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, TextIO, Tuple
+from filtered_logger import (
+    PII_FIELDS, RedactingFormatter, RedactionEngine, get_redaction_engine,
+)
+
+
+CHUNK_SIZE = 8 * 1024 * 1024
+CSV_BATCH_SIZE = 10000
+ENCODING = "utf-8"
+_source = None
+_engine = None
+
+
+def chunk_bounds(
+        data: mmap.mmap, chunk_size: int,
+        ) -> Iterator[Tuple[int, int]]:
+    """Splits a mapped file into (start, end) offsets on line boundaries.
+    """
+    size, start = (len(data), 0)
+    while start < size:
+        end = min(start + chunk_size, size)
+        if end < size:
+            newline = data.find(b'\n', end - 1)
+            end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def redact_chunk_bytes(engine: RedactionEngine, chunk: bytes) -> bytes:
+    """Redacts every line of a chunk of a log file, leaving the line
+    endings out of the fields and back in place afterwards.
+    """
+    text = chunk.decode(ENCODING, "surrogateescape")
+    lines, bodies = (text.splitlines(True), text.splitlines())
+    redacted = engine.redact_many(bodies)
+    return ''.join(
+        body + line[len(original):]
+        for body, original, line in zip(redacted, bodies, lines)
+    ).encode(ENCODING, "surrogateescape")
+
+
+def _init_worker(path: str, fields: List[str], redaction: str,
+                 separator: str) -> None:
+    """Maps the input file and builds the engine once per worker.
+    """
+    global _source, _engine
+    with open(path, 'rb') as f:
+        _source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _engine = get_redaction_engine(fields, redaction, separator)
+
+
+def _redact_chunk(bounds: Tuple[int, int]) -> bytes:
+    """Redacts the chunk of the worker's mapped file at the given offsets.
+    """
+    start, end = bounds
+    return redact_chunk_bytes(_engine, _source[start:end])
+
+
+def redact_file(path: str, output: BinaryIO, fields: List[str],
+                redaction: str, separator: str, workers: int = None,
+                chunk_size: int = CHUNK_SIZE) -> int:
+    """Redacts a log file in a process pool, keeping the line order.
+    Returns the number of bytes read.
+    """
+    if os.path.getsize(path) == 0:
+        return 0
+    initargs = (path, fields, redaction, separator)
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            Pool(workers, _init_worker, initargs) as pool:
+        for chunk in pool.imap(_redact_chunk, chunk_bounds(data, chunk_size)):
+            output.write(chunk)
+        return len(data)
+
+
+def split_csv_record(record: str, delimiter: str = ',',
+                     maxsplit: int = -1) -> List[str]:
+    """Splits a CSV record into its raw fields, quotes included.
+    Like str.split, the last item holds the rest after maxsplit splits.
+    """
+    fields, start = ([], 0)
+    while len(fields) != maxsplit:
+        end = start
+        if record.startswith('"', start):
+            end = record.find('"', start + 1)
+            while end != -1 and record.startswith('"', end + 1):
+                end = record.find('"', end + 2)
+            if end == -1:
+                break
+        end = record.find(delimiter, end)
+        if end == -1:
+            break
+        fields.append(record[start:end])
+        start = end + len(delimiter)
+    fields.append(record[start:])
+    return fields
+
+
+def csv_records(lines: Iterable[str]) -> Iterator[str]:
+    """Joins physical lines into CSV records, following quoted newlines.
+    """
+    pending = None
+    for line in lines:
+        pending = line if pending is None else pending + line
+        if pending.count('"') % 2 == 0:
+            yield pending
+            pending = None
+    if pending is not None:
+        yield pending
+
+
+def redact_csv_record(record: str, indexes: List[int], redaction: str,
+                      delimiter: str = ',') -> str:
+    """Replaces the columns at the given sorted indexes of a CSV record.
+    """
+    body = record.rstrip('\r\n')
+    fields = split_csv_record(body, delimiter, indexes[-1] + 1 if indexes
+                              else 0)
+    quoted_redaction = '"{}"'.format(redaction)
+    for i in indexes:
+        if i < len(fields):
+            quoted = fields[i].startswith('"')
+            fields[i] = quoted_redaction if quoted else redaction
+    return '{}{}'.format(delimiter.join(fields), record[len(body):])
+
+
+def redact_csv(source: TextIO, output: TextIO, fields: List[str],
+               redaction: str, delimiter: str = ',',
+               batch_size: int = CSV_BATCH_SIZE) -> int:
+    """Redacts the PII columns of a CSV stream in batches of records.
+    Returns the number of records written, header included.
+    """
+    records = csv_records(source)
+    header = next(records, None)
+    if header is None:
+        return 0
+    output.write(header)
+    columns = [
+        column.strip().strip('"')
+        for column in split_csv_record(header.rstrip('\r\n'), delimiter)
+    ]
+    indexes = [i for i, column in enumerate(columns) if column in fields]
+    count = 1
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return count
+        output.writelines([
+            redact_csv_record(record, indexes, redaction, delimiter)
+            for record in batch
+        ])
+        count += len(batch)
+
+
+def main():
+    """Redacts a log file given on the command line.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("input", help="log file to redact")
+    parser.add_argument("output", nargs="?", default="-",
+                        help="destination file (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("-c", "--chunk-size", type=int,
+                        default=CHUNK_SIZE // (1024 * 1024),
+                        help="chunk size in MB")
+    parser.add_argument("-f", "--fields", default=','.join(PII_FIELDS))
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION)
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR)
+    parser.add_argument("--csv", action="store_true",
+                        help="redact the PII columns of a CSV file")
+    args = parser.parse_args()
+    fields = args.fields.split(',')
+    start = time.perf_counter()
+    if args.csv:
+        size, args.workers = (os.path.getsize(args.input), 1)
+        options = {"encoding": ENCODING, "errors": "surrogateescape",
+                   "newline": ""}
+        output = sys.stdout if args.output == "-" else \
+            open(args.output, 'w', **options)
+        try:
+            with open(args.input, 'r', **options) as source:
+                redact_csv(source, output, fields, args.redaction)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    else:
+        output = sys.stdout.buffer if args.output == "-" else \
+            open(args.output, 'wb')
+        try:
+            size = redact_file(args.input, output, fields, args.redaction,
+                               args.separator, args.workers,
+                               args.chunk_size * 1024 * 1024)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+    elapsed = time.perf_counter() - start
+    print("Redacted {:.1f} MB in {:.2f}s ({:.1f} MB/s, {} workers)".format(
+        size / 1e6, elapsed, size / 1e6 / elapsed, args.workers),
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,99 @@
 #!/usr/bin/env python3
 """A module for encrypting passwords.
 """
+import time
 import bcrypt
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
 
 
-def hash_password(password: str) -> bytes:
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 16
+
+
+def hash_password(password: str, rounds: int = DEFAULT_ROUNDS) -> bytes:
     """Hashes a password using a random salt.
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """Checks is a hashed password was formed from the given password.
     """
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """Reads the cost factor a bcrypt hash was made with.
+    """
+    return int(hashed_password.split(b'$')[2])
+
+
+def check_password(
+        hashed_password: bytes, password: str, rounds: int = DEFAULT_ROUNDS,
+        ) -> Tuple[bool, bool]:
+    """Checks a password and whether its valid hash should be remade
+    with the current cost factor, only when it was made with a lower one.
+    """
+    if not is_valid(hashed_password, password):
+        return (False, False)
+    return (True, hash_rounds(hashed_password) < rounds)
+
+
+def calibrate_rounds(
+        target_ms: float = 50, min_rounds: int = MIN_ROUNDS,
+        max_rounds: int = MAX_ROUNDS,
+        ) -> int:
+    """Finds the highest cost factor hashing within a latency budget
+    on this host, or min_rounds if none does.
+    """
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > target_ms:
+            break
+        best = rounds
+        if elapsed_ms * 2 > target_ms:
+            break
+    return best
+
+
+def _ordered_map(
+        func: Callable, args: Iterable[tuple], workers: int, processes: bool,
+        ) -> Iterator:
+    """Runs a function over argument tuples in a pool, yielding the results
+    in input order with at most two tasks in flight per worker.
+    """
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(workers) as pool:
+        pending = deque()
+        for item in args:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(func, *item))
+        while pending:
+            yield pending.popleft().result()
+
+
+def hash_passwords(
+        passwords: Iterable[str], workers: int = 4,
+        rounds: int = DEFAULT_ROUNDS, processes: bool = False,
+        ) -> Iterator[bytes]:
+    """Hashes many passwords in parallel, in input order.
+    """
+    args = ((password, rounds) for password in passwords)
+    return _ordered_map(hash_password, args, workers, processes)
+
+
+def verify_many(
+        pairs: Iterable[Tuple[bytes, str]], workers: int = 4,
+        processes: bool = False,
+        ) -> Iterator[bool]:
+    """Checks many (hashed_password, password) pairs in parallel,
+    in input order.
+    """
+    return _ordered_map(is_valid, pairs, workers, processes)
@@ -3,9 +3,16 @@
 """
 import os
 import re
+import sys
+import time
+import queue
 import logging
+import sqlite3
+import threading
 import mysql.connector
-from typing import List
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, List, Iterable, Iterator, Mapping, Tuple
 
 
 patterns = {
@@ -13,6 +20,61 @@ patterns = {
     'replace': lambda x: r'\g<field>={}'.format(x),
 }
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+ENGINE_CACHE_SIZE = 64
+OVERFLOW_POLICIES = ("block", "drop-oldest", "drop-new")
+
+
+class RedactionEngine:
+    """Redacts fields from log lines with a regex compiled only once.
+    """
+
+    def __init__(self, fields: Iterable[str], redaction: str, separator: str):
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self._field_set = frozenset(self.fields)
+        extract, replace = (patterns["extract"], patterns["replace"])
+        self._pattern = re.compile(extract(self.fields, separator))
+        self._replace = replace(redaction)
+
+    def redact(self, message: str) -> str:
+        """Filters a log line.
+        """
+        return self._pattern.sub(self._replace, message)
+
+    def redact_many(self, messages: Iterable[str]) -> List[str]:
+        """Filters a sequence of log lines.
+        """
+        sub, replace = (self._pattern.sub, self._replace)
+        return [sub(replace, message) for message in messages]
+
+    def redact_row(self, row: Mapping[str, object]) -> str:
+        """Builds a filtered log line from a mapping of column values.
+        """
+        redaction, field_set = (self.redaction, self._field_set)
+        parts = [
+            '{}={}'.format(k, redaction if k in field_set else v)
+            for k, v in row.items()
+        ]
+        return '{}{}'.format('{} '.format(self.separator).join(parts),
+                             self.separator)
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def _cached_engine(
+        fields: Tuple[str, ...], redaction: str, separator: str,
+        ) -> RedactionEngine:
+    """Builds the engine for a given set of redaction rules.
+    """
+    return RedactionEngine(fields, redaction, separator)
+
+
+def get_redaction_engine(
+        fields: Iterable[str], redaction: str, separator: str,
+        ) -> RedactionEngine:
+    """Retrieves a cached engine for a given set of redaction rules.
+    """
+    return _cached_engine(tuple(fields), redaction, separator)
 
 
 def filter_datum(
@@ -20,15 +82,164 @@ def filter_datum(
         ) -> str:
     """Filters a log line.
     """
-    extract, replace = (patterns["extract"], patterns["replace"])
-    return re.sub(extract(fields, separator), replace(redaction), message)
+    return get_redaction_engine(fields, redaction, separator).redact(message)
+
+
+class AsyncRedactingHandler(logging.Handler):
+    """Formats and writes log records on a background worker thread.
+    """
+
+    def __init__(self, stream=None, queue_size: int = 10000,
+                 overflow: str = "block", batch_size: int = 100):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ', '.join(OVERFLOW_POLICIES)))
+        super(AsyncRedactingHandler, self).__init__()
+        self.stream = sys.stderr if stream is None else stream
+        self.queue = queue.Queue(queue_size)
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.stats = {"queued": 0, "dropped": 0, "written": 0}
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Queues a record according to the overflow policy.
+        """
+        if self._closed:
+            return
+        if self.overflow == "block":
+            if not self._put(record):
+                self._count("dropped")
+                return
+        elif self.overflow == "drop-new":
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self._count("dropped")
+                return
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(record)
+                    break
+                except queue.Full:
+                    self._drop_oldest()
+        self._count("queued")
 
+    def _put(self, item) -> bool:
+        """Waits for room in the queue while the worker is alive to make
+        some, and tells whether the item was queued.
+        """
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        while self._worker.is_alive():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _count(self, name: str, n: int = 1) -> None:
+        """Adds to a counter of the stats.
+        """
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def _drop_oldest(self) -> None:
+        """Discards the oldest queued record.
+        """
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            return
+        self.queue.task_done()
+        self._count("dropped")
+
+    def _run(self) -> None:
+        """Drains the queue in batches until the handler is closed.
+        """
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            try:
+                self._write(records)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(records) != len(batch):
+                return
+
+    def _write(self, records: List[logging.LogRecord]) -> None:
+        """Formats a batch of records and writes them at once, reporting
+        the records which could not be written through handleError.
+        """
+        lines, formatted = ([], [])
+        for record in records:
+            try:
+                lines.append(self.format(record) + "\n")
+                formatted.append(record)
+            except Exception:
+                self.handleError(record)
+        if lines:
+            try:
+                self.stream.write(''.join(lines))
+                self.stream.flush()
+            except Exception:
+                for record in formatted:
+                    self.handleError(record)
+                return
+            self._count("written", len(lines))
+
+    def flush(self) -> None:
+        """Waits until every queued record has been written, or the
+        worker is no longer running.
+        """
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and self._worker.is_alive():
+                self.queue.all_tasks_done.wait(0.1)
 
-def get_logger() -> logging.Logger:
+    def close(self) -> None:
+        """Flushes pending records and stops the worker thread, or drops
+        them if the worker is no longer running.
+        """
+        if not self._closed:
+            self._closed = True
+            if self._put(None):
+                self._worker.join()
+            else:
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.queue.task_done()
+                    self._count("dropped")
+        super(AsyncRedactingHandler, self).close()
+
+
+def get_logger(asynchronous: bool = False, queue_size: int = 10000,
+               overflow: str = "block") -> logging.Logger:
     """Creates a new logger for user data.
     """
     logger = logging.getLogger("user_data")
-    stream_handler = logging.StreamHandler()
+    if asynchronous:
+        stream_handler = AsyncRedactingHandler(
+            queue_size=queue_size, overflow=overflow,
+        )
+    else:
+        stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
     logger.setLevel(logging.INFO)
     logger.propagate = False
@@ -36,8 +247,8 @@ def get_logger() -> logging.Logger:
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
-    """Creates a connector to a database.
+def connect_mysql() -> mysql.connector.connection.MySQLConnection:
+    """Creates a connector to a MySQL database.
     """
     db_host = os.getenv("PERSONAL_DATA_DB_HOST", "localhost")
     db_name = os.getenv("PERSONAL_DATA_DB_NAME", "")
@@ -53,26 +264,232 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return connection
 
 
+def connect_sqlite() -> sqlite3.Connection:
+    """Creates a connector to a SQLite database file.
+    """
+    db_name = os.getenv("PERSONAL_DATA_DB_NAME", "")
+    return sqlite3.connect(db_name, check_same_thread=False)
+
+
+DB_BACKENDS = {
+    "mysql": connect_mysql,
+    "sqlite": connect_sqlite,
+}
+
+
+class PooledConnection:
+    """A pooled DB-API connection which is given back to its pool on close.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection, created_at: float):
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+
+    def __getattr__(self, name: str):
+        """Forwards everything else to the underlying connection.
+        """
+        return getattr(self._connection, name)
+
+    def __enter__(self) -> 'PooledConnection':
+        """Uses the connection in a with block.
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Returns the connection to its pool, as leaving a with block
+        closes a MySQL connection.
+        """
+        self.close()
+
+    def __del__(self) -> None:
+        """Returns the connection of a wrapper which was never closed.
+        """
+        if '_connection' in self.__dict__:
+            self.close()
+
+    def close(self) -> None:
+        """Returns the connection to its pool.
+        """
+        if self._connection is not None:
+            connection, self._connection = (self._connection, None)
+            self._pool.release(connection, self._created_at)
+
+
+class ConnectionPool:
+    """A bounded pool of DB-API connections.
+    """
+
+    def __init__(self, connect: Callable, size: int = 5,
+                 pre_ping: bool = True, max_lifetime: float = 3600,
+                 idle_timeout: float = 600, timeout: float = 30):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.waits = 0
+        self.wait_time = 0.0
+        self._idle = deque()
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        """Hands out an idle connection or opens a new one, waiting for
+        a connection to be released when the pool is exhausted, at most
+        timeout seconds (the pool's timeout by default).
+        """
+        if timeout is None:
+            timeout = self.timeout
+        with self._cond:
+            if self._in_use >= self.size:
+                self.waits += 1
+                start = time.monotonic()
+                ready = self._cond.wait_for(
+                    lambda: self._in_use < self.size, timeout,
+                )
+                self.wait_time += time.monotonic() - start
+                if not ready:
+                    raise TimeoutError("no database connection available")
+            self._in_use += 1
+        while True:
+            with self._cond:
+                if not self._idle:
+                    break
+                connection, created_at, last_used = self._idle.pop()
+            now = time.monotonic()
+            if now - created_at <= self.max_lifetime and \
+                    now - last_used <= self.idle_timeout and \
+                    (not self.pre_ping or self._ping(connection)):
+                return PooledConnection(self, connection, created_at)
+            self._discard(connection)
+        try:
+            connection, created_at = (self.connect(), time.monotonic())
+        except Exception:
+            self._forget()
+            raise
+        return PooledConnection(self, connection, created_at)
+
+    def release(self, connection, created_at: float) -> None:
+        """Takes back a connection handed out by acquire.
+        """
+        try:
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            self._forget()
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((connection, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, float]:
+        """Reports the usage of the pool.
+        """
+        with self._cond:
+            return {
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+            }
+
+    def _forget(self) -> None:
+        """Frees the slot of a connection which will not come back.
+        """
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _ping(connection) -> bool:
+        """Checks that a connection is still usable.
+        """
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection) -> None:
+        """Closes a connection, ignoring errors.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool() -> ConnectionPool:
+    """Retrieves the process-wide connection pool, configured from
+    the environment on first use.
+    """
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            backend = os.getenv("PERSONAL_DATA_DB_BACKEND", "mysql")
+            _db_pool = ConnectionPool(
+                DB_BACKENDS[backend],
+                size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5")),
+                pre_ping=os.getenv("PERSONAL_DATA_DB_POOL_PRE_PING",
+                                   "1") != "0",
+                max_lifetime=float(os.getenv(
+                    "PERSONAL_DATA_DB_POOL_MAX_LIFETIME", "3600")),
+                idle_timeout=float(os.getenv(
+                    "PERSONAL_DATA_DB_POOL_IDLE_TIMEOUT", "600")),
+                timeout=float(os.getenv(
+                    "PERSONAL_DATA_DB_POOL_TIMEOUT", "30")),
+            )
+        return _db_pool
+
+
+def get_db() -> PooledConnection:
+    """Creates a connector to a database.
+    """
+    return get_db_pool().acquire()
+
+
+def fetch_batches(cursor, batch_size: int) -> Iterator[List[tuple]]:
+    """Yields the rows of an executed query in batches.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
 def main():
     """Logs the information about user records in a table.
     """
     fields = "name,email,phone,ssn,password,ip,last_login,user_agent"
     columns = fields.split(',')
     query = "SELECT {} FROM users;".format(fields)
+    batch_size = int(os.getenv("PERSONAL_DATA_DB_BATCH_SIZE", "1000"))
     info_logger = get_logger()
     connection = get_db()
-    with connection.cursor() as cursor:
+    cursor = connection.cursor()
+    try:
         cursor.execute(query)
-        rows = cursor.fetchall()
-        for row in rows:
-            record = map(
-                lambda x: '{}={}'.format(x[0], x[1]),
-                zip(columns, row),
-            )
-            msg = '{};'.format('; '.join(list(record)))
-            args = ("user_data", logging.INFO, None, None, msg, None, None)
-            log_record = logging.LogRecord(*args)
-            info_logger.handle(log_record)
+        for rows in fetch_batches(cursor, batch_size):
+            for row in rows:
+                args = ("user_data", logging.INFO, None, None, "", None, None)
+                log_record = logging.LogRecord(*args)
+                log_record.row = dict(zip(columns, row))
+                info_logger.handle(log_record)
+    finally:
+        cursor.close()
+        connection.close()
 
 
 class RedactingFormatter(logging.Formatter):
@@ -87,13 +504,19 @@ class RedactingFormatter(logging.Formatter):
     def __init__(self, fields: List[str]):
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.engine = get_redaction_engine(
+            fields, self.REDACTION, self.SEPARATOR,
+        )
 
     def format(self, record: logging.LogRecord) -> str:
         """formats a LogRecord.
         """
+        row = getattr(record, 'row', None)
+        if row is not None:
+            record.msg, record.args = (self.engine.redact_row(row), None)
+            return super(RedactingFormatter, self).format(record)
         msg = super(RedactingFormatter, self).format(record)
-        txt = filter_datum(self.fields, self.REDACTION, msg, self.SEPARATOR)
-        return txt
+        return self.engine.redact(msg)
 
 
 if __name__ == "__main__":
@@ -19,10 +19,12 @@ def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - the number of saves of each objects performed and skipped
     """
     from models.user import User
     stats = {}
     stats['users'] = User.count()
+    stats['user_writes'] = User.writes()
     return jsonify(stats)
 
 
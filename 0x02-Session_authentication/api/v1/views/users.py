@@ -2,18 +2,87 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request
+from models.base import TIMESTAMP_FORMAT, parse_timestamp
 from models.user import User
+from typing import Iterator
+import json
+
+
+STREAM_BATCH = 1000
+
+
+def user_cursor(user: User) -> str:
+    """ Return the cursor of the page following a user: its creation time
+    and ID, the keys the users are ordered by
+    """
+    return "{},{}".format(user.created_at.strftime(TIMESTAMP_FORMAT), user.id)
+
+
+def parse_cursor(cursor: str) -> tuple:
+    """ Return the (created_at, ID) key of a cursor, None if it's invalid
+    """
+    created_at, _, user_id = cursor.partition(',')
+    try:
+        return (parse_timestamp(created_at), user_id)
+    except ValueError:
+        return None
+
+
+def stream_users(batch: int = STREAM_BATCH) -> Iterator[str]:
+    """ Yield the JSON array of all users in chunks, reading batch users
+    at a time so that memory doesn't grow with the number of users
+    """
+    yield '['
+    after, separator = (None, '')
+    while True:
+        users = User.page('created_at', after, batch)
+        if len(users) > 0:
+            yield separator + ','.join(u.to_json_string() for u in users)
+            separator = ','
+        if len(users) < batch:
+            break
+        after = (users[-1].created_at, users[-1].id)
+    yield ']\n'
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): return a page of at most limit users, ordered by
+        creation time and ID
+      - after (optional): cursor of the page, "next" of the previous page
+      - stream (optional): 1 to stream the list of all users
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, joined from the JSON
+        string cached by each user
+      - with limit, {"users": page of User objects, "next": cursor of the
+        next page or null}
+      - 400 if limit or after is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit, after = (request.args.get('limit'), request.args.get('after'))
+    if limit is None and after is None:
+        if request.args.get('stream') in ('1', 'true'):
+            return Response(stream_users(), mimetype='application/json')
+        all_users = ','.join(user.to_json_string() for user in User.all())
+        return Response('[{}]\n'.format(all_users),
+                        mimetype='application/json')
+    try:
+        limit = int(limit if limit is not None else STREAM_BATCH)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({'error': "limit must be a positive integer"}), 400
+    if after is not None:
+        after = parse_cursor(after)
+        if after is None:
+            return jsonify({'error': "after is not a valid cursor"}), 400
+    users = User.page('created_at', after, limit)
+    next_cursor = user_cursor(users[-1]) if len(users) == limit else None
+    return Response('{{"users":[{}],"next":{}}}\n'.format(
+        ','.join(user.to_json_string() for user in users),
+        json.dumps(next_cursor)), mimetype='application/json')
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+""" Benchmarks of the models storage
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from api.v1.app import app
+from api.v1.views.users import view_all_users
+from models import base
+from models.base import DATA, TIMESTAMP_FORMAT, format_timestamp, \
+    timestamp_seconds
+from models.persistence import PERSISTENCES, WriteBehindPersistence
+from models.snapshot import SNAPSHOT_FORMATS
+from models.user import User
+
+
+def populate(n_users: int, model=User, reindex: bool = True):
+    """ Fill the User store in memory with n_users users
+    """
+    DATA['User'] = {}
+    for i in range(n_users):
+        user = model(email="user{}@hbtn.io".format(i),
+                     first_name="First{}".format(i % 1000),
+                     last_name="Last{}".format(i % 5000))
+        DATA['User'][user.id] = user
+    if reindex:
+        User.reindex()
+
+
+def dict_user(**kwargs) -> SimpleNamespace:
+    """ Build the attributes of a User in an object with a __dict__,
+    as users were stored before they declared __slots__
+    """
+    user = User(**kwargs)
+    return SimpleNamespace(**{k: getattr(user, k) for k in user.slots()})
+
+
+def timed(func, repeat: int) -> float:
+    """ Return the average duration of a call in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_search(sizes):
+    """ Compare email lookups through the index and by full scan
+    """
+    for n_users in sizes:
+        populate(n_users)
+        email = "user{}@hbtn.io".format(n_users // 2)
+
+        def scan():
+            return [u for u in DATA['User'].values() if u.email == email]
+
+        indexed = timed(lambda: User.search({'email': email}), 1000)
+        scanned = timed(scan, 5)
+        names = {'first_name': 'First7', 'last_name': 'Last7'}
+        multi = timed(lambda: User.search(names), 100)
+        print("{:>9,} users: search {:>10.1f} us  scan {:>12.1f} us  "
+              "first+last name {:>10.1f} us".format(
+                  n_users, indexed, scanned, multi))
+
+
+def bench_save(sizes):
+    """ Compare the cost of User.save() for each persistence mode
+    """
+    os.chdir(tempfile.mkdtemp())
+    for n_users in sizes:
+        populate(n_users)
+        User.save_to_file()
+        users = [User.get(user_id) for user_id in list(DATA['User'])[:100]]
+        modes = {name: persistence()
+                 for name, persistence in PERSISTENCES.items()}
+        modes['write-behind'] = WriteBehindPersistence(
+            PERSISTENCES['snapshot']())
+        results = []
+        for name, persistence in sorted(modes.items()):
+            base.PERSISTENCE = persistence
+
+            def save_all():
+                for user in users:
+                    user.first_name = "Saved {}".format(name)
+                    user.save()
+                User.flush()
+
+            results.append("{} {:>10.1f} us".format(
+                name, timed(save_all, 1) / len(users)))
+        print("{:>9,} users: save {}".format(n_users, '  '.join(results)))
+
+
+def bench_load(sizes):
+    """ Compare User.load_from_file() startup time for each snapshot format
+    """
+    os.chdir(tempfile.mkdtemp())
+    for n_users in sizes:
+        populate(n_users)
+        results = []
+        for name, snapshot in sorted(SNAPSHOT_FORMATS.items()):
+            base.SNAPSHOT = snapshot()
+            User.save_to_file()
+            size = sum(map(os.path.getsize, User.file_paths()))
+            results.append("{} {:>8.2f} s {:>7.1f} MB".format(
+                name, timed(User.load_from_file, 1) / 1e6, size / 1e6))
+        base.SNAPSHOT, base.LOAD_MODE = (SNAPSHOT_FORMATS['binary'](), 'lazy')
+        results.append("binary lazy {:>8.2f} s".format(
+            timed(User.load_from_file, 1) / 1e6))
+        base.LOAD_MODE = 'eager'
+        print("{:>9,} users: load {}".format(n_users, '  '.join(results)))
+
+
+def bench_memory(sizes):
+    """ Compare the memory held by the User store with __slots__ instances
+    and with instances carrying a __dict__, indexes excluded
+    """
+    for n_users in sizes:
+        results = []
+        for name, model in (('slots', User), ('dict', dict_user)):
+            DATA['User'] = {}
+            tracemalloc.start()
+            populate(n_users, model, False)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append("{} {:>8.1f} MB".format(name, size / 1e6))
+        DATA['User'] = {}
+        print("{:>9,} users: memory {}".format(n_users, '  '.join(results)))
+
+
+def stress_worker(n_ops: int, seed: int, errors: list):
+    """ Create, update, delete and search users in random order
+    """
+    rng = random.Random(seed)
+    mine = []
+    try:
+        for i in range(n_ops):
+            op = rng.random()
+            if op < 0.3 or len(mine) == 0:
+                user = User(email="stress{}-{}@hbtn.io".format(seed, i),
+                            first_name="First{}".format(i % 10))
+                user.save()
+                mine.append(user)
+            elif op < 0.5:
+                user = rng.choice(mine)
+                user.first_name = "First{}".format(rng.randrange(10))
+                user.save()
+            elif op < 0.6:
+                mine.pop(rng.randrange(len(mine))).remove()
+            elif op < 0.9:
+                user = rng.choice(mine)
+                if User.search({'email': user.email}) != [user]:
+                    raise AssertionError("{} not found".format(user.email))
+            else:
+                User.search({'first_name': 'First3'})
+                User.count()
+    except Exception as e:
+        errors.append(e)
+
+
+def bench_stress(sizes, threads: int = 8, n_ops: int = 2000):
+    """ Hammer the User store from several threads with the journal
+    persistence, then check that memory, indexes and file agree
+    """
+    os.chdir(tempfile.mkdtemp())
+    base.PERSISTENCE = PERSISTENCES['journal']()
+    for n_users in sizes:
+        populate(n_users)
+        User.save_to_file()
+        errors = []
+        workers = [
+            threading.Thread(target=stress_worker, args=(n_ops, i, errors))
+            for i in range(threads)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duration = time.perf_counter() - start
+        users = {user.id: user.to_json(True) for user in User.all()}
+        for user in User.all():
+            if user not in User.search({'email': user.email}):
+                errors.append(AssertionError("index misses " + user.id))
+        User.load_from_file()
+        if users != {user.id: user.to_json(True) for user in User.all()}:
+            errors.append(AssertionError("file differs from memory"))
+        print("{:>9,} users: {} threads {:>8.0f} ops/s  {} errors{}".format(
+            n_users, threads, threads * n_ops / duration, len(errors),
+            ''.join("\n    {!r}".format(e) for e in errors[:5])))
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """ Return a percentile of sorted samples
+    """
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def bench_latency(sizes, writers: int = 2, duration: float = 2.0):
+    """ Compare listing all users from the published version and under
+    the read lock, while other threads keep saving users
+    """
+    os.chdir(tempfile.mkdtemp())
+    base.PERSISTENCE = PERSISTENCES['journal']()
+
+    def locked_all():
+        with User.lock().reading():
+            return list(DATA['User'].values())
+
+    for n_users in sizes:
+        populate(n_users)
+        User.save_to_file()
+        user_ids = list(DATA['User'])
+        results = []
+        for name, listing in (('version', User.all), ('locked', locked_all)):
+            stop, saves, samples = (threading.Event(), [0], [])
+
+            def write(writer: int):
+                i = 0
+                while not stop.is_set():
+                    i += 1
+                    user = User.get(random.choice(user_ids))
+                    user.first_name = "Saved {}-{}".format(writer, i)
+                    user.save()
+                    saves[0] += 1
+
+            threads = [threading.Thread(target=write, args=(i,))
+                       for i in range(writers)]
+            for thread in threads:
+                thread.start()
+            end = time.perf_counter() + duration
+            while time.perf_counter() < end:
+                start = time.perf_counter()
+                listing()
+                samples.append((time.perf_counter() - start) * 1e3)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            samples.sort()
+            results.append("{} p50 {:>7.1f} ms p99 {:>7.1f} ms {:>6.0f} "
+                           "saves/s".format(name, percentile(samples, 0.5),
+                                            percentile(samples, 0.99),
+                                            saves[0] / duration))
+        print("{:>9,} users: all {}".format(n_users, '  '.join(results)))
+
+
+def bench_shards(sizes, counts=(1, 4, 16)):
+    """ Compare the cost of User.save() with the snapshot persistence and
+    of User.load_from_file() for several numbers of shard files
+    """
+    os.chdir(tempfile.mkdtemp())
+    base.PERSISTENCE = PERSISTENCES['snapshot']()
+    for n_users in sizes:
+        populate(n_users)
+        users = [User.get(user_id) for user_id in list(DATA['User'])[:10]]
+        results = []
+        for shards in counts:
+            base.SHARDS = shards
+            User.save_to_file()
+
+            def save_all():
+                for user in users:
+                    user.first_name = "Saved {}".format(shards)
+                    user.save()
+
+            save = timed(save_all, 1) / len(users) / 1e3
+            load = timed(User.load_from_file, 1) / 1e6
+            results.append("{} save {:>7.1f} ms load {:>6.2f} s".format(
+                shards, save, load))
+            for file_path in User.file_paths():
+                os.remove(file_path)
+        base.SHARDS = 1
+        print("{:>9,} users: shards {}".format(n_users, '  '.join(results)))
+
+
+def legacy_to_json(obj) -> dict:
+    """ Convert a user to a JSON dictionary attribute by attribute, as
+    Base.to_json did before it was compiled per class
+    """
+    result = {}
+    for key, value in obj.attribute_items():
+        if key[0] == '_':
+            continue
+        if type(value) is datetime:
+            result[key] = value.strftime(TIMESTAMP_FORMAT)
+        else:
+            result[key] = value
+    return result
+
+
+def bench_serialize(sizes):
+    """ Compare the conversion of users to JSON dictionaries, and the
+    listing of all users as JSON with and without the cached strings
+    """
+    for n_users in sizes:
+        populate(n_users, reindex=False)
+        users = list(DATA['User'].values())
+        for user in users:
+            user.clean()
+        legacy = timed(lambda: [legacy_to_json(u) for u in users], 1)
+        compiled = timed(lambda: [u.to_json() for u in users], 1)
+        dumped = timed(lambda: json.dumps([u.to_json() for u in users]), 1)
+        ','.join(u.to_json_string() for u in users)
+        cached = timed(lambda: ','.join(u.to_json_string() for u in users), 1)
+        print("{:>9,} users: to_json legacy {:>8.0f} ms  compiled {:>8.0f} ms"
+              "  listing dumps {:>8.0f} ms  cached {:>8.0f} ms".format(
+                  n_users, legacy / 1e3, compiled / 1e3, dumped / 1e3,
+                  cached / 1e3))
+
+
+def listing_size(query: str) -> int:
+    """ Read the response of GET /api/v1/users to a query chunk by chunk,
+    following the next cursors, and return its size in bytes
+    """
+    size, url = (0, '/api/v1/users?' + query)
+    while url is not None:
+        with app.test_request_context(url):
+            response = view_all_users()
+        url, chunks = (None, response.response)
+        for chunk in chunks:
+            size += len(chunk)
+        if 'limit' in query:
+            cursor = json.loads(chunk[chunk.rindex(b'"next":') + 7:-2])
+            if cursor is not None:
+                url = '/api/v1/users?{}&after={}'.format(query, cursor)
+    return size
+
+
+def bench_listing(sizes):
+    """ Compare the time and peak memory of listing all users at once,
+    streamed, and page by page, once their JSON strings are cached
+    """
+    for n_users in sizes:
+        populate(n_users)
+        for user in DATA['User'].values():
+            user.clean()
+        listing_size('')
+        results = []
+        for name, query in (('all', ''), ('stream', 'stream=1'),
+                            ('pages', 'limit=1000')):
+            tracemalloc.start()
+            start = time.perf_counter()
+            listing_size(query)
+            duration = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append("{} {:>7.2f} s {:>7.1f} MB".format(
+                name, duration, peak / 1e6))
+        print("{:>9,} users: listing {}".format(
+            n_users, '  '.join(results)))
+
+
+def bench_timestamps(sizes):
+    """ Compare parsing and formatting timestamps with strptime/strftime
+    and with the epoch seconds stored by the models
+    """
+    for n_users in sizes:
+        rng = random.Random(n_users)
+        seconds = [rng.randrange(1500000000, 1800000000)
+                   for _ in range(n_users)]
+        texts = [format_timestamp(s) for s in seconds]
+        dates = [datetime.strptime(t, TIMESTAMP_FORMAT) for t in texts]
+        assert [timestamp_seconds(t) for t in texts] == seconds
+        assert [d.strftime(TIMESTAMP_FORMAT) for d in dates] == texts
+        results = (
+            timed(lambda: [datetime.strptime(t, TIMESTAMP_FORMAT)
+                           for t in texts], 1),
+            timed(lambda: [timestamp_seconds(t) for t in texts], 1),
+            timed(lambda: [d.strftime(TIMESTAMP_FORMAT) for d in dates], 1),
+            timed(lambda: [format_timestamp(s) for s in seconds], 1),
+        )
+        print("{:>9,} timestamps: parse strptime {:>7.1f} ms seconds {:>7.1f}"
+              " ms  format strftime {:>7.1f} ms seconds {:>7.1f} ms".format(
+                  n_users, *(r / 1e3 for r in results)))
+
+
+SCENARIOS = {
+    'latency': bench_latency,
+    'listing': bench_listing,
+    'load': bench_load,
+    'memory': bench_memory,
+    'save': bench_save,
+    'search': bench_search,
+    'serialize': bench_serialize,
+    'shards': bench_shards,
+    'stress': bench_stress,
+    'timestamps': bench_timestamps,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+    SCENARIOS[args.scenario](args.sizes)
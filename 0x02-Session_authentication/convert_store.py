@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+""" Convert the User file store between snapshot formats, or import it
+into a database
+Usage: ./convert_store.py <source format> <target format or storage>
+"""
+import sys
+from os import getenv
+from models import base
+from models.snapshot import SNAPSHOT_FORMATS
+from models.storage import STORAGES
+from models.user import User
+
+
+def convert(source: str, target: str):
+    """ Load the User store in one format and write it in another, or
+    insert it into a database, updating the users already there
+    """
+    base.SNAPSHOT = SNAPSHOT_FORMATS[source]()
+    base.STORAGE = None
+    User.load_from_file()
+    if target in STORAGES:
+        storage = STORAGES[target](
+            getenv('MODELS_SQLITE_PATH', '.db.sqlite3'))
+        storage.save_all(User, User.all())
+        print("{} users imported into {}".format(
+            User.count(), storage.file_path))
+        return
+    base.SNAPSHOT = SNAPSHOT_FORMATS[target]()
+    User.save_to_file()
+    print("{} users written to {}".format(
+        User.count(), ', '.join(User.file_paths())))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in SNAPSHOT_FORMATS or \
+            sys.argv[2] not in set(SNAPSHOT_FORMATS) | set(STORAGES):
+        print(__doc__.strip())
+        print("Formats: {}".format(', '.join(sorted(SNAPSHOT_FORMATS))))
+        print("Storages: {}".format(', '.join(sorted(STORAGES))))
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2])
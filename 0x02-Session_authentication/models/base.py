@@ -1,40 +1,169 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Mapping, Set, Tuple, Union
+from os import getenv, path
+from models.index import INDEX_TYPES, SortedIndex
+from models.lazy import LazyObjects
+from models.lock import ReadWriteLock
+from models.persistence import make_persistence, sync
+from models.snapshot import SNAPSHOT_FORMATS
+from models.storage import make_storage
+from models.version import Version
+import heapq
 import json
+import os
+import re
+import threading
+import time
 import uuid
+import zlib
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMPS = {'_created_at': 'created_at', '_updated_at': 'updated_at'}
+DAY_SECONDS = {}
+DAY_PREFIXES = {}
 DATA = {}
+SLOTS = {}
+SERIALIZERS = {}
+LOCKS = {}
+VERSIONS = {}
+WRITES = {}
+WRITES_LOCK = threading.Lock()
+MISSING = object()
+LOCKS_LOCK = threading.Lock()
+PERSISTENCE = make_persistence()
+STORAGE = make_storage()
+SNAPSHOT = SNAPSHOT_FORMATS[getenv('MODELS_SNAPSHOT_FORMAT', 'json')]()
+LOAD_MODE = getenv('MODELS_LOAD_MODE', 'eager')
+LAZY_CACHE_SIZE = int(getenv('MODELS_LAZY_CACHE_SIZE', '10000'))
+VERSION_MERGE = int(getenv('MODELS_VERSION_MERGE', '1000'))
+SHARDS = int(getenv('MODELS_SHARDS', '1'))
 Base = TypeVar('Base')
 
 
+def timestamp_seconds(value: Union[str, int, datetime]) -> int:
+    """ Convert a timestamp, formatted, in seconds since the epoch or as a
+    datetime, to seconds since the epoch
+    The date part of formatted timestamps is only parsed once per day.
+    """
+    if type(value) is int:
+        return value
+    if isinstance(value, datetime):
+        return (value - EPOCH) // timedelta(seconds=1)
+    if len(value) != 19 or value[10] != 'T' or not value[11:].replace(
+            ':', '').isdigit():
+        return timestamp_seconds(datetime.strptime(value, TIMESTAMP_FORMAT))
+    day = DAY_SECONDS.get(value[:10])
+    if day is None:
+        date = datetime.strptime(value[:10], TIMESTAMP_FORMAT[:8])
+        day = DAY_SECONDS[value[:10]] = timestamp_seconds(date)
+    hours, minutes, seconds = (
+        int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return timestamp_seconds(datetime.strptime(value, TIMESTAMP_FORMAT))
+    return day + hours * 3600 + minutes * 60 + seconds
+
+
+def format_timestamp(seconds: int) -> str:
+    """ Format a timestamp in seconds since the epoch with TIMESTAMP_FORMAT
+    The date part is only formatted once per day.
+    """
+    day, seconds = divmod(seconds, 86400)
+    prefix = DAY_PREFIXES.get(day)
+    if prefix is None:
+        prefix = DAY_PREFIXES[day] = (EPOCH + timedelta(days=day)).strftime(
+            TIMESTAMP_FORMAT[:9])
+    return "{}{:02d}:{:02d}:{:02d}".format(
+        prefix, seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def parse_timestamp(value: Union[str, int]) -> datetime:
+    """ Convert a stored timestamp, formatted or in seconds since the epoch
+    """
+    return EPOCH + timedelta(seconds=timestamp_seconds(value))
+
+
 class Base():
     """ Base class
+    Models declare their attributes in __slots__ so that instances don't
+    carry a __dict__ each. Timestamps are kept in seconds since the epoch
+    and only converted to datetime when read. Objects loaded or saved
+    track the attributes
+    changed since, so that saving an unchanged object writes nothing,
+    and cache their JSON string until they change.
+    Objects published to the readers are read-only: get() returns a copy
+    to change and save() publishes a new object.
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at', '_changes', '_json',
+                 '_published')
+    indexed_attributes = {}
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
+        object.__setattr__(self, '_changes', None)
+        object.__setattr__(self, '_json', None)
+        object.__setattr__(self, '_published', False)
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self._created_at = timestamp_seconds(kwargs.get('created_at'))
         else:
-            self.created_at = datetime.utcnow()
+            self._created_at = int(time.time())
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self._updated_at = timestamp_seconds(kwargs.get('updated_at'))
         else:
-            self.updated_at = datetime.utcnow()
+            self._updated_at = int(time.time())
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation time
+        """
+        return EPOCH + timedelta(seconds=self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: Union[str, int, datetime]):
+        """ Setter of the creation time
+        """
+        self._created_at = timestamp_seconds(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the last update time
+        """
+        return EPOCH + timedelta(seconds=self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: Union[str, int, datetime]):
+        """ Setter of the last update time
+        """
+        self._updated_at = timestamp_seconds(value)
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, remembering that it changed when the object
+        is tracked, unless the object is published
+        """
+        if self._published:
+            raise AttributeError(
+                "{} {} is published read-only, change a copy from get() "
+                "or copy()".format(self.__class__.__name__, self.id))
+        changes = self._changes
+        if changes is not None and name not in changes and \
+                getattr(self, name, MISSING) != value:
+            if type(changes) is tuple:
+                object.__setattr__(self, '_changes', {name})
+            else:
+                changes.add(name)
+        object.__setattr__(self, name, value)
 
     def __eq__(self, other: Base) -> bool:
         """ Equality
@@ -45,69 +174,486 @@ class Base():
             return False
         return (self.id == other.id)
 
+    @classmethod
+    def slots(cls) -> List[str]:
+        """ Return the attributes declared in __slots__ by the class and
+        its parents, in declaration order, timestamps by their public name
+        """
+        if cls not in SLOTS:
+            names = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get('__slots__', ())
+                names.extend([slots] if type(slots) is str else slots)
+            SLOTS[cls] = [TIMESTAMPS.get(name, name) for name in names
+                          if name not in ('__dict__', '__weakref__',
+                                          '_changes', '_json',
+                                          '_published')]
+        return SLOTS[cls]
+
+    def changes(self) -> Union[Set[str], None]:
+        """ Return the stored attributes changed since the object was
+        loaded or saved, None when it never was
+        """
+        return self.stored_names(self._changes)
+
+    @classmethod
+    def stored_names(cls, names: Iterable[str]) -> Union[Set[str], None]:
+        """ Return the stored attributes among attribute names,
+        timestamps by their public name, None for None
+        """
+        if names is None:
+            return None
+        slots = cls.slots()
+        return {TIMESTAMPS.get(name, name) for name in names
+                if TIMESTAMPS.get(name, name) in slots}
+
+    def clean(self):
+        """ Start tracking changes from the current attributes
+        """
+        object.__setattr__(self, '_changes', ())
+        object.__setattr__(self, '_json', None)
+
+    def take_changes(self) -> Union[Set[str], None]:
+        """ Return the changed attributes like changes(), and start
+        tracking the changes made from now on, which the next save writes
+        """
+        changes = self._changes
+        self.clean()
+        return self.stored_names(changes)
+
+    def copy(self, published: bool = False) -> Base:
+        """ Return a copy of the object tracking the changes since the
+        same save, read-only when published
+        """
+        obj = self.__class__.__new__(self.__class__)
+        set_attribute = object.__setattr__
+        for name in self.slots():
+            if name in TIMESTAMPS.values():
+                name = '_' + name
+            set_attribute(obj, name, getattr(self, name))
+        if self.__class__.__dictoffset__ != 0:
+            obj.__dict__.update(self.__dict__)
+        changes = self._changes
+        set_attribute(obj, '_changes',
+                      set(changes) if type(changes) is set else changes)
+        set_attribute(obj, '_json', self._json)
+        set_attribute(obj, '_published', published)
+        return obj
+
+    @classmethod
+    def from_stored(cls, attributes: dict, published: bool = False) -> Base:
+        """ Return an object loaded from stored attributes, read-only when
+        it is published to the readers
+        Objects of classes declaring all their attributes in __slots__
+        are filled in directly, without going through __init__.
+        """
+        if cls.__dictoffset__ != 0:
+            obj = cls(**attributes)
+            obj.clean()
+            object.__setattr__(obj, '_published', published)
+            return obj
+        obj = cls.__new__(cls)
+        set_attribute = object.__setattr__
+        for name in cls.slots():
+            value = attributes.get(name)
+            if name in ('created_at', 'updated_at'):
+                set_attribute(obj, '_' + name, int(time.time())
+                              if value is None else timestamp_seconds(value))
+            else:
+                set_attribute(obj, name, value)
+        set_attribute(obj, '_changes', ())
+        set_attribute(obj, '_json', None)
+        set_attribute(obj, '_published', published)
+        return obj
+
+    @classmethod
+    def writes(cls) -> dict:
+        """ Return the number of saves of the class performed and skipped
+        because nothing changed
+        """
+        return dict(WRITES.get(cls.__name__, {'performed': 0, 'skipped': 0}))
+
+    @classmethod
+    def count_write(cls, kind: str):
+        """ Count a write performed or skipped
+        """
+        with WRITES_LOCK:
+            writes = WRITES.setdefault(
+                cls.__name__, {'performed': 0, 'skipped': 0})
+            writes[kind] += 1
+
+    def attribute_items(self) -> Iterable[tuple]:
+        """ Return the (name, value) pairs of the stored attributes
+        """
+        for key in self.slots():
+            yield key, getattr(self, key)
+        yield from getattr(self, '__dict__', {}).items()
+
+    @classmethod
+    def serializer(cls, for_serialization: bool = False):
+        """ Return the function converting an object of the class to a JSON
+        dictionary, compiled once from the attributes of the class
+        """
+        key = (cls, for_serialization)
+        if key not in SERIALIZERS:
+            names = [name for name in cls.slots()
+                     if for_serialization or name[0] != '_']
+            source = "def to_json(obj):\n    result = {{{}}}\n".format(
+                ', '.join("{0!r}: format_timestamp(obj._{0})".format(name)
+                          if name in TIMESTAMPS.values() else
+                          "{0!r}: obj.{0} if type(obj.{0}) is not datetime "
+                          "else obj.{0}.strftime(FORMAT)".format(name)
+                          for name in names))
+            if cls.__dictoffset__ != 0:
+                source += (
+                    "    for key, value in obj.__dict__.items():\n"
+                    "        if {} or key[0] != '_':\n"
+                    "            result[key] = value if type(value) is not "
+                    "datetime else value.strftime(FORMAT)\n"
+                ).format(for_serialization)
+            source += "    return result\n"
+            namespace = {'datetime': datetime, 'FORMAT': TIMESTAMP_FORMAT,
+                         'format_timestamp': format_timestamp}
+            exec(compile(source, "<{} serializer>".format(cls.__name__),
+                         'exec'), namespace)
+            SERIALIZERS[key] = namespace['to_json']
+        return SERIALIZERS[key]
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        return self.serializer(for_serialization)(self)
+
+    def to_json_string(self) -> str:
+        """ Return the JSON dictionary of the object as a string, cached
+        while the object is unchanged since it was loaded or saved
+        """
+        if type(self._changes) is tuple and self._json is not None:
+            return self._json
+        text = json.dumps(self.to_json(), sort_keys=True,
+                          separators=(',', ':'))
+        if type(self._changes) is tuple:
+            object.__setattr__(self, '_json', text)
+        return text
+
+    def to_record(self) -> dict:
+        """ Convert the object to a dictionary for binary snapshots,
+        with timestamps in seconds since the epoch
+        """
+        record = {key: getattr(self, '_' + key) if key in TIMESTAMPS.values()
+                  else self.to_record_value(key, getattr(self, key))
+                  for key in self.slots()}
+        for key, value in getattr(self, '__dict__', {}).items():
+            record[key] = self.to_record_value(key, value)
+        return record
 
     @classmethod
-    def load_from_file(cls):
-        """ Load all objects from file
+    def lock(cls) -> ReadWriteLock:
+        """ Return the lock guarding the objects of the class: shared by
+        readers, held alone by a writer changing the objects or the file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        if s_class not in LOCKS:
+            with LOCKS_LOCK:
+                LOCKS.setdefault(s_class, ReadWriteLock())
+        return LOCKS[s_class]
+
+    @classmethod
+    def file_path(cls, shard: int = 0) -> str:
+        """ Return the snapshot file of a shard of the class
+        """
+        if SHARDS == 1:
+            return ".db_{}.{}".format(cls.__name__, SNAPSHOT.extension)
+        return ".db_{}.{}.{}".format(cls.__name__, shard, SNAPSHOT.extension)
+
+    @classmethod
+    def file_paths(cls) -> List[str]:
+        """ Return the snapshot files of the class, one per shard
+        """
+        return [cls.file_path(shard) for shard in range(SHARDS)]
+
+    @classmethod
+    def stray_file_paths(cls) -> List[str]:
+        """ Return the snapshot files of the class written for another
+        number of shards than the current one
+        """
+        pattern = re.compile(r"\.db_{}(\.\d+)?\.{}$".format(
+            re.escape(cls.__name__), re.escape(SNAPSHOT.extension)))
+        return sorted(p for p in os.listdir('.') if pattern.match(p) and
+                      p not in cls.file_paths())
+
+    @classmethod
+    def shard_error(cls, file_paths: List[str]) -> RuntimeError:
+        """ Return the error raised on loading snapshot files written for
+        another number of shards than the current one
+        """
+        return RuntimeError(
+            "{} written for another number of shards than MODELS_SHARDS={}, "
+            "reshard them with ./reshard_store.py <current shards> {}".format(
+                ', '.join(file_paths), SHARDS, SHARDS))
+
+    @classmethod
+    def check_shards(cls, file_paths: List[str],
+                     stored_ids: Iterable[Tuple[str, int]]):
+        """ Raise the shard error when objects, given as (ID, index of their
+        file in file_paths), aren't in the file of their shard
+        """
+        if SHARDS == 1:
             return
+        shards = [cls.file_paths().index(p) for p in file_paths]
+        crc32 = zlib.crc32
+        wrong = {file_paths[i] for obj_id, i in stored_ids
+                 if crc32(obj_id.encode('utf-8')) % SHARDS != shards[i]}
+        if len(wrong) > 0:
+            raise cls.shard_error(sorted(wrong))
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def shard(cls, obj_id: str) -> int:
+        """ Return the shard of an object by ID
+        """
+        if SHARDS == 1:
+            return 0
+        return zlib.crc32(obj_id.encode('utf-8')) % SHARDS
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def to_record_value(cls, key: str, value):
+        """ Convert the value of an attribute to its value in a record
+        """
+        if type(value) is datetime:
+            return int((value - EPOCH).total_seconds())
+        return value
+
+    @classmethod
+    def record_value(cls, key: str, value):
+        """ Convert a value of a binary snapshot record to the value of
+        the attribute once loaded
+        """
+        if key in ('created_at', 'updated_at') and value is not None:
+            return parse_timestamp(value)
+        return value
+
+    @classmethod
+    def load_file(cls, file_path: str) -> dict:
+        """ Return the objects of a snapshot file by ID
+        """
+        with open(file_path, 'rb') as f:
+            return {obj_id: cls.from_published(obj_json)
+                    for obj_id, obj_json in SNAPSHOT.load(f)}
+
+    @classmethod
+    def load_from_file(cls):
+        """ Load all objects from file, one thread per shard file
+        In lazy mode with a binary snapshot, objects are only read from
+        the file when first accessed and indexes when first used.
+        Nothing is loaded when the objects are in a database.
+        Raises RuntimeError when the files were written for another number
+        of shards, found by their names or by objects stored in the file
+        of another shard than theirs, instead of loading only some of them.
         """
+        if STORAGE is not None:
+            return
+        stray = cls.stray_file_paths()
+        if len(stray) > 0:
+            raise cls.shard_error(stray)
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        file_paths = [p for p in cls.file_paths() if path.exists(p)]
+        with cls.lock().writing():
+            DATA[s_class] = {}
+            lazy = LOAD_MODE == 'lazy' and SNAPSHOT.indexable
+            if lazy and len(file_paths) > 0:
+                files = [open(file_path, 'rb') for file_path in file_paths]
+                try:
+                    objs = LazyObjects(
+                        files, SNAPSHOT, cls.from_published, LAZY_CACHE_SIZE,
+                    )
+                finally:
+                    for f in files:
+                        f.close()
+                cls.check_shards(file_paths, objs.stored_ids())
+                DATA[s_class] = objs
+            elif len(file_paths) > 0:
+                with ThreadPoolExecutor(len(file_paths)) as executor:
+                    loaded = list(executor.map(cls.load_file, file_paths))
+                cls.check_shards(file_paths, ((obj_id, i)
+                                              for i, objs in enumerate(loaded)
+                                              for obj_id in objs))
+                for objs in loaded:
+                    DATA[s_class].update(objs)
+
+            for op, obj_id, obj_json in PERSISTENCE.replay(cls):
+                objs = DATA[s_class]
+                if op == 'save':
+                    objs[obj_id] = cls.from_published(obj_json)
+                elif op == 'update' and obj_id in objs:
+                    attributes = objs[obj_id].to_json(True)
+                    attributes.update(obj_json)
+                    objs[obj_id] = cls.from_published(attributes)
+                elif op == 'remove':
+                    objs.pop(obj_id, None)
+            cls.publish()
+
+    @classmethod
+    def from_published(cls, attributes: dict) -> Base:
+        """ Return a read-only object loaded from stored attributes, to
+        publish to the readers
+        """
+        return cls.from_stored(attributes, True)
+
+    @classmethod
+    def indexes(cls, version: Version = None) -> dict:
+        """ Return the indexes by attribute of a version, the one last
+        published by default, building them on first use
+        """
+        version = cls.version() if version is None else version
+        if len(version.indexes) < len(cls.indexed_attributes):
+            version.indexes.update(cls.build_indexes(version.base))
+        return version.indexes
+
+    @classmethod
+    def build_indexes(cls, objs: Mapping) -> dict:
+        """ Return indexes by attribute built from objects by ID
+        """
+        indexes = {
+            attr: INDEX_TYPES[kind]()
+            for attr, kind in cls.indexed_attributes.items()
+        }
+        attrs = list(indexes)
+        if len(attrs) > 0 and isinstance(objs, LazyObjects):
+            rows = list(objs.attribute_rows(attrs, cls.record_value))
+        elif len(attrs) > 0:
+            rows = [(obj_id, tuple(getattr(obj, a) for a in attrs))
+                    for obj_id, obj in list(objs.items())]
+        for i, attr in enumerate(attrs):
+            indexes[attr].build((obj_id, values[i])
+                                for obj_id, values in rows)
+        return indexes
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def reindex(cls):
+        """ Rebuild the indexes and the published version from all stored
+        objects
+        """
+        with cls.lock().writing():
+            cls.publish()
+
+    @classmethod
+    def publish(cls, version: Version = None):
+        """ Publish a version of the stored objects to the readers
+        When none is given, it is made from a copy of the stored objects
+        with new indexes, built on first use in lazy mode. When the given
+        one holds too many changes, they are merged into a copy of the
+        stored objects and copies of its indexes. Called with the lock
+        held alone.
+        """
+        objs = DATA.setdefault(cls.__name__, {})
+        if version is None:
+            version = Version(objs.copy())
+            if not isinstance(objs, LazyObjects):
+                cls.indexes(version)
+        elif len(version.changes) > VERSION_MERGE:
+            version = version.merged(objs.copy())
+        VERSIONS[cls.__name__] = version
+
+    @classmethod
+    def version(cls) -> Version:
+        """ Return the version of the objects last published
+        """
+        version = VERSIONS.get(cls.__name__)
+        if version is None:
+            with cls.lock().writing():
+                if VERSIONS.get(cls.__name__) is None:
+                    cls.publish()
+            version = VERSIONS[cls.__name__]
+        return version
+
+    @classmethod
+    def save_to_file(cls, shards: Iterable[int] = None):
+        """ Save all objects to file, or only the shards given, unless
+        they are in a database
+        """
+        if STORAGE is not None:
+            return
+        s_class = cls.__name__
+        shards = set(range(SHARDS) if shards is None else shards)
+        with cls.lock().writing():
+            objs = DATA[s_class]
+            shard_objs = {shard: [] for shard in shards}
+            if SHARDS == 1:
+                shard_objs[0] = list(objs.values())
+            else:
+                for obj_id in list(objs):
+                    shard = cls.shard(obj_id)
+                    if shard in shard_objs:
+                        shard_objs[shard].append(objs[obj_id])
+            for shard in shard_objs:
+                file_path = cls.file_path(shard)
+                with open(file_path + '.tmp', 'wb') as f:
+                    SNAPSHOT.dump(shard_objs[shard], f)
+                    sync(f)
+                os.replace(file_path + '.tmp', file_path)
+            if len(shards) == SHARDS:
+                PERSISTENCE.snapshot_written(cls)
+
+    @classmethod
+    def flush(cls):
+        """ Write the changes still pending in write-behind mode
+        """
+        PERSISTENCE.flush()
 
     def save(self):
-        """ Save current object
+        """ Save current object, unless nothing changed since it was loaded
+        or saved, passing the changed attributes to the persistence
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        changes = self.changes()
+        if changes is not None and len(changes) == 0:
+            self.__class__.count_write('skipped')
+            return
+        if STORAGE is not None:
+            object.__setattr__(self, '_updated_at', int(time.time()))
+            changes = self.take_changes()
+            if changes is not None:
+                changes.add('updated_at')
+            STORAGE.save(self.__class__, self, changes)
+        else:
+            with self.__class__.lock().writing():
+                object.__setattr__(self, '_updated_at', int(time.time()))
+                changes = self.take_changes()
+                if changes is not None:
+                    changes.add('updated_at')
+                obj = self.copy(True)
+                DATA[s_class][self.id] = obj
+                self.__class__.publish(self.__class__.version().saved(obj))
+                PERSISTENCE.persist(
+                    self.__class__, [obj], [],
+                    None if changes is None else {self.id: changes})
+        self.__class__.count_write('performed')
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        if not self._published:
+            object.__setattr__(self, '_changes', None)
+        if STORAGE is not None:
+            STORAGE.remove(self.__class__, self.id)
+            self.__class__.count_write('performed')
+            return
+        with self.__class__.lock().writing():
+            if DATA[s_class].get(self.id) is not None:
+                del DATA[s_class][self.id]
+                self.__class__.publish(
+                    self.__class__.version().removed(self.id))
+                PERSISTENCE.persist(self.__class__, [], [self.id])
+                self.__class__.count_write('performed')
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        if STORAGE is not None:
+            return STORAGE.count(cls)
+        return len(cls.version())
 
     @classmethod
     def all(cls) -> Iterable[Base]:
@@ -117,18 +663,25 @@ class Base():
 
     @classmethod
     def get(cls, id: str) -> Base:
-        """ Return one object by ID
+        """ Return one object by ID, a copy to change and save when it
+        comes from the published version
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        if STORAGE is not None:
+            return STORAGE.get(cls, id)
+        obj = cls.version().get(id)
+        return None if obj is None else obj.copy()
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[Base]:
         """ Search all objects with matching attributes
+        Objects are read from the database when there is one, otherwise
+        from the version last published, without locking. They are
+        read-only, get() returns a copy to change.
+        Candidates are narrowed through the indexes of the version for
+        the indexed attributes, most selective first, and only compared
+        on the other attributes.
         """
-        s_class = cls.__name__
-
-        def _search(obj):
+        def _search(obj, attributes=attributes):
             if len(attributes) == 0:
                 return True
             for k, v in attributes.items():
@@ -136,4 +689,79 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        if STORAGE is not None:
+            return STORAGE.search(cls, attributes)
+        version = cls.version()
+        if len(attributes) == 0:
+            return version.values()
+        if not any(k in cls.indexed_attributes for k in attributes):
+            return list(filter(_search, version.values()))
+        indexes = cls.indexes(version)
+        lookups = sorted(
+            (version.count(k, v), k)
+            for k, v in attributes.items() if k in indexes
+        )
+        ids = None
+        for _, k in lookups:
+            found = version.lookup(k, attributes[k])
+            ids = found if ids is None else ids & found
+            if len(ids) == 0:
+                break
+        others = {k: v for k, v in attributes.items() if k not in indexes}
+        objs = (version.get(i) for i in ids)
+        return [obj for obj in objs
+                if obj is not None and _search(obj, others)]
+
+    @classmethod
+    def search_range(cls, attribute: str, low=None, high=None) -> List[Base]:
+        """ Search all objects with low <= attribute <= high, ordered by
+        the attribute when it has a sorted index
+        """
+        def _search(obj):
+            value = getattr(obj, attribute)
+            if value is None:
+                return False
+            if low is not None and value < low:
+                return False
+            if high is not None and high < value:
+                return False
+            return True
+
+        if STORAGE is not None and attribute in cls.slots():
+            return STORAGE.search_range(cls, attribute, low, high)
+        if STORAGE is not None:
+            return list(filter(_search, STORAGE.search(cls, {})))
+        version = cls.version()
+        index = cls.indexes(version).get(attribute)
+        if not isinstance(index, SortedIndex):
+            return list(filter(_search, version.values()))
+        ids = version.range(attribute, low, high)
+        objs = (version.get(i) for i in ids)
+        return [obj for obj in objs if obj is not None]
+
+    @classmethod
+    def page(cls, attribute: str, after: Tuple = None,
+             limit: int = 100) -> List[Base]:
+        """ Return up to limit objects ordered by (attribute, ID), after
+        the (value, ID) key of the last object of the previous page
+        Objects without a value of the attribute are left out.
+        """
+        def _key(obj):
+            return (getattr(obj, attribute), obj.id)
+
+        if STORAGE is not None and attribute in cls.slots():
+            return STORAGE.page(cls, attribute, after, limit)
+        if STORAGE is not None:
+            objs = STORAGE.search(cls, {})
+        else:
+            version = cls.version()
+            index = cls.indexes(version).get(attribute)
+            if isinstance(index, SortedIndex):
+                ids = version.after(attribute, *(after or (None, None)),
+                                    limit)
+                objs = (version.get(i) for i in ids)
+                return [obj for obj in objs if obj is not None]
+            objs = version.values()
+        objs = (obj for obj in objs if getattr(obj, attribute) is not None
+                and (after is None or _key(obj) > tuple(after)))
+        return heapq.nsmallest(limit, objs, key=_key)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, List, Set, Tuple
+
+
+class HashIndex():
+    """ Equality index from attribute values to object IDs
+    Copies share the sets of IDs of each value with the index they were
+    made from until they change them.
+    """
+
+    def __init__(self):
+        """ Initialize an empty index
+        """
+        self._ids = {}
+        self._values = {}
+        self._unhashable = set()
+        self._shared = set()
+
+    def _own(self, value: Any) -> Set[str]:
+        """ Return the set of IDs of a value, copied first when it is
+        shared with another index
+        """
+        ids = self._ids.get(value)
+        if ids is None:
+            ids = self._ids[value] = set()
+        elif value in self._shared:
+            ids = self._ids[value] = set(ids)
+            self._shared.discard(value)
+        return ids
+
+    def add(self, obj_id: str, value: Any):
+        """ Index an object ID under a value, replacing its previous value
+        """
+        self.remove(obj_id)
+        try:
+            self._own(value).add(obj_id)
+        except TypeError:
+            self._unhashable.add(obj_id)
+        self._values[obj_id] = value
+
+    def remove(self, obj_id: str):
+        """ Remove an object ID from the index
+        """
+        if obj_id not in self._values:
+            return
+        value = self._values.pop(obj_id)
+        if obj_id in self._unhashable:
+            self._unhashable.discard(obj_id)
+            return
+        ids = self._own(value)
+        ids.discard(obj_id)
+        if len(ids) == 0:
+            del self._ids[value]
+
+    def updated(self, added: Iterable[Tuple[str, Any]],
+                removed: Iterable[str]) -> 'HashIndex':
+        """ Return a copy of the index with IDs removed and (object ID,
+        value) pairs added, leaving this one unchanged
+        """
+        index = HashIndex()
+        index._ids = dict(self._ids)
+        index._values = dict(self._values)
+        index._unhashable = set(self._unhashable)
+        index._shared = set(self._ids)
+        for obj_id in removed:
+            index.remove(obj_id)
+        for obj_id, value in added:
+            index.add(obj_id, value)
+        return index
+
+    def lookup(self, value: Any) -> Set[str]:
+        """ Return the IDs of objects which held a value when indexed
+        """
+        try:
+            ids = self._ids.get(value, ())
+        except TypeError:
+            ids = ()
+        return set(ids) | {obj_id for obj_id in self._unhashable
+                           if self._values[obj_id] == value}
+
+    def count(self, value: Any) -> int:
+        """ Return an upper bound of the number of IDs lookup returns for
+        a value
+        """
+        try:
+            ids = self._ids.get(value, ())
+        except TypeError:
+            ids = ()
+        return len(ids) + len(self._unhashable)
+
+    def build(self, items: Iterable[Tuple[str, Any]]):
+        """ Replace the content of the index with (object ID, value) pairs
+        """
+        self.clear()
+        for obj_id, value in items:
+            self._values[obj_id] = value
+            try:
+                ids = self._ids.get(value)
+            except TypeError:
+                self._unhashable.add(obj_id)
+                continue
+            if ids is None:
+                self._ids[value] = {obj_id}
+            else:
+                ids.add(obj_id)
+
+    def clear(self):
+        """ Remove every entry
+        """
+        self._ids.clear()
+        self._values.clear()
+        self._unhashable.clear()
+        self._shared.clear()
+
+
+class SortedIndex():
+    """ Ordered index of (value, object ID) pairs for range queries
+    Values which can't be ordered (None, mixed types) are kept aside
+    and compared one by one on equality lookups.
+    """
+
+    def __init__(self):
+        """ Initialize an empty index
+        """
+        self._sorted_values = []
+        self._sorted_ids = []
+        self._values = {}
+        self._unordered = set()
+
+    def _position(self, obj_id: str, value: Any) -> int:
+        """ Return where (value, obj_id) is or would be in the index
+        """
+        start = bisect_left(self._sorted_values, value)
+        end = bisect_right(self._sorted_values, value, start)
+        return bisect_left(self._sorted_ids, obj_id, start, end)
+
+    def add(self, obj_id: str, value: Any):
+        """ Index an object ID under a value, replacing its previous value
+        """
+        self.remove(obj_id)
+        self._values[obj_id] = value
+        try:
+            if value is None:
+                raise TypeError("None can't be ordered")
+            i = self._position(obj_id, value)
+        except TypeError:
+            self._unordered.add(obj_id)
+            return
+        self._sorted_values.insert(i, value)
+        self._sorted_ids.insert(i, obj_id)
+
+    def remove(self, obj_id: str):
+        """ Remove an object ID from the index
+        """
+        if obj_id not in self._values:
+            return
+        value = self._values.pop(obj_id)
+        if obj_id in self._unordered:
+            self._unordered.discard(obj_id)
+            return
+        i = self._position(obj_id, value)
+        del self._sorted_values[i]
+        del self._sorted_ids[i]
+
+    def _bounds(self, low: Any, high: Any) -> slice:
+        """ Return the positions of the values with low <= value <= high
+        """
+        values = self._sorted_values
+        start = 0 if low is None else bisect_left(values, low)
+        end = len(values) if high is None else bisect_right(values, high)
+        return slice(start, max(start, end))
+
+    def lookup(self, value: Any) -> Set[str]:
+        """ Return the IDs of objects which held a value when indexed
+        """
+        unordered = {obj_id for obj_id in self._unordered
+                     if self._values[obj_id] == value}
+        if value is None:
+            return unordered
+        try:
+            bounds = self._bounds(value, value)
+        except TypeError:
+            return unordered
+        return set(self._sorted_ids[bounds]) | unordered
+
+    def count(self, value: Any) -> int:
+        """ Return an upper bound of the number of IDs lookup returns for
+        a value
+        """
+        if value is None:
+            return len(self._unordered)
+        try:
+            bounds = self._bounds(value, value)
+        except TypeError:
+            return len(self._unordered)
+        return bounds.stop - bounds.start + len(self._unordered)
+
+    def range(self, low: Any = None, high: Any = None) -> List[str]:
+        """ Return the IDs with low <= value <= high, in (value, ID) order
+        """
+        return self._sorted_ids[self._bounds(low, high)]
+
+    def value(self, obj_id: str) -> Any:
+        """ Return the value an object ID is indexed under
+        """
+        return self._values[obj_id]
+
+    def after(self, value: Any, obj_id: str, limit: int) -> List[str]:
+        """ Return up to limit IDs after (value, obj_id) in (value, ID)
+        order, from the first one when value is None
+        """
+        start = 0
+        if value is not None:
+            start = bisect_left(self._sorted_values, value)
+            end = bisect_right(self._sorted_values, value, start)
+            start = bisect_right(self._sorted_ids, obj_id, start, end)
+        return self._sorted_ids[start:start + limit]
+
+    def build(self, items: Iterable[Tuple[str, Any]]):
+        """ Replace the content of the index with (object ID, value) pairs,
+        sorting them once instead of inserting them one by one
+        """
+        self.clear()
+        ordered = []
+        for obj_id, value in items:
+            self._values[obj_id] = value
+            if value is None:
+                self._unordered.add(obj_id)
+            else:
+                ordered.append((value, obj_id))
+        try:
+            ordered.sort()
+        except TypeError:
+            for value, obj_id in ordered:
+                self._values.pop(obj_id)
+                self.add(obj_id, value)
+            return
+        self._sorted_values = [value for value, _ in ordered]
+        self._sorted_ids = [obj_id for _, obj_id in ordered]
+
+    def updated(self, added: Iterable[Tuple[str, Any]],
+                removed: Iterable[str]) -> 'SortedIndex':
+        """ Return a copy of the index with IDs removed and (object ID,
+        value) pairs added, leaving this one unchanged
+        The pairs are merged in one pass over the index instead of being
+        inserted one by one.
+        """
+        added = list(added)
+        index = SortedIndex()
+        index._values = dict(self._values)
+        index._unordered = set(self._unordered)
+        cuts = []
+        for obj_id in set(removed).union(obj_id for obj_id, _ in added):
+            if obj_id not in index._values:
+                continue
+            value = index._values.pop(obj_id)
+            if obj_id in index._unordered:
+                index._unordered.discard(obj_id)
+            else:
+                cuts.append(self._position(obj_id, value))
+        values, ids, start = ([], [], 0)
+        for i in sorted(cuts):
+            values.extend(self._sorted_values[start:i])
+            ids.extend(self._sorted_ids[start:i])
+            start = i + 1
+        values.extend(self._sorted_values[start:])
+        ids.extend(self._sorted_ids[start:])
+        index._sorted_values, index._sorted_ids = (values, ids)
+        ordered = []
+        for obj_id, value in added:
+            index._values[obj_id] = value
+            if value is None:
+                index._unordered.add(obj_id)
+            else:
+                ordered.append((value, obj_id))
+        try:
+            ordered.sort()
+            inserts = [(index._position(obj_id, value), value, obj_id)
+                       for value, obj_id in ordered]
+        except TypeError:
+            for value, obj_id in ordered:
+                index._values.pop(obj_id)
+                index.add(obj_id, value)
+            return index
+        index._sorted_values, index._sorted_ids, start = ([], [], 0)
+        for i, value, obj_id in inserts:
+            index._sorted_values.extend(values[start:i])
+            index._sorted_ids.extend(ids[start:i])
+            index._sorted_values.append(value)
+            index._sorted_ids.append(obj_id)
+            start = i
+        index._sorted_values.extend(values[start:])
+        index._sorted_ids.extend(ids[start:])
+        return index
+
+    def clear(self):
+        """ Remove every entry
+        """
+        self._sorted_values.clear()
+        self._sorted_ids.clear()
+        self._values.clear()
+        self._unordered.clear()
+
+
+INDEX_TYPES = {
+    'hash': HashIndex,
+    'sorted': SortedIndex,
+}
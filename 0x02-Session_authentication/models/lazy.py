@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+""" Lazy loading module
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Iterator, List, Tuple
+import mmap
+import pickle
+import threading
+
+
+class LazyObjects(MutableMapping):
+    """ Objects of a class by ID, read from memory-mapped binary
+    snapshot files only when first accessed
+
+    Objects saved or replayed since the load are kept in memory, the
+    ones hydrated from the snapshot are kept in an LRU cache shared by
+    the reading threads and by the copies published to them, which only
+    use it for the objects they still read from the snapshot.
+    """
+
+    def __init__(self, files: List, snapshot,
+                 hydrate: Callable[[dict], object], cache_size: int = 10000):
+        """ Index the records of open snapshot files by ID
+        """
+        self._data = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                      for f in files]
+        self._offsets = {
+            obj_id: (i, offset, length)
+            for i, data in enumerate(self._data)
+            for obj_id, offset, length in snapshot.records(data)
+        }
+        self._hydrate = hydrate
+        self._pinned = {}
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_size = cache_size
+
+    def _record(self, obj_id: str) -> dict:
+        """ Unpickle the stored record of an object
+        """
+        i, offset, length = self._offsets[obj_id]
+        return pickle.loads(self._data[i][offset:offset + length])
+
+    def __getitem__(self, obj_id: str):
+        """ Return an object, hydrating it on first access
+        """
+        obj = self._pinned.get(obj_id)
+        if obj is not None:
+            return obj
+        if obj_id not in self._offsets:
+            raise KeyError(obj_id)
+        with self._cache_lock:
+            obj = self._cache.get(obj_id)
+            if obj is not None:
+                self._cache.move_to_end(obj_id)
+                return obj
+        obj = self._hydrate(self._record(obj_id))
+        with self._cache_lock:
+            self._cache[obj_id] = obj
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return obj
+
+    def __setitem__(self, obj_id: str, obj):
+        """ Store an object in memory until the next load
+        """
+        self._pinned[obj_id] = obj
+        self._offsets.pop(obj_id, None)
+        with self._cache_lock:
+            self._cache.pop(obj_id, None)
+
+    def __delitem__(self, obj_id: str):
+        """ Forget an object
+        """
+        if obj_id not in self:
+            raise KeyError(obj_id)
+        self._offsets.pop(obj_id, None)
+        self._pinned.pop(obj_id, None)
+        with self._cache_lock:
+            self._cache.pop(obj_id, None)
+
+    def __contains__(self, obj_id) -> bool:
+        """ Check for an object without hydrating it
+        """
+        return obj_id in self._pinned or obj_id in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the IDs of the objects, each once even if it is
+        saved meanwhile
+        """
+        ids = dict.fromkeys(list(self._offsets))
+        ids.update(dict.fromkeys(list(self._pinned)))
+        return iter(list(ids))
+
+    def __len__(self) -> int:
+        """ Return the number of objects
+        """
+        return len(self._offsets) + len(self._pinned)
+
+    def copy(self) -> 'LazyObjects':
+        """ Return a copy of the objects, left unchanged by later saves,
+        sharing the memory maps and the cache
+        """
+        objs = LazyObjects.__new__(LazyObjects)
+        objs._data = self._data
+        objs._offsets = dict(self._offsets)
+        objs._hydrate = self._hydrate
+        objs._pinned = dict(self._pinned)
+        objs._cache = self._cache
+        objs._cache_lock = self._cache_lock
+        objs.cache_size = self.cache_size
+        return objs
+
+    def stored_ids(self) -> Iterator[Tuple[str, int]]:
+        """ Return the (ID, file index) of every object still read from
+        the snapshot files
+        """
+        for obj_id, (i, _, _) in list(self._offsets.items()):
+            yield obj_id, i
+
+    def attribute_rows(
+            self, attributes: List[str],
+            convert: Callable[[str, object], object],
+            ) -> Iterator[Tuple[str, tuple]]:
+        """ Return the (ID, values) of some attributes of every object,
+        read from the stored records without hydrating the objects
+        """
+        for obj_id in list(self._offsets):
+            with self._cache_lock:
+                obj = self._cache.get(obj_id)
+            if obj is not None:
+                yield obj_id, tuple(getattr(obj, a) for a in attributes)
+                continue
+            record = self._record(obj_id)
+            yield obj_id, tuple(convert(a, record.get(a)) for a in attributes)
+        for obj_id, obj in list(self._pinned.items()):
+            yield obj_id, tuple(getattr(obj, a) for a in attributes)
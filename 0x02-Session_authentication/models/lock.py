@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+""" Lock module
+"""
+from contextlib import contextmanager
+import threading
+
+
+class ReadWriteLock():
+    """ Lock shared by any number of readers or held by one writer
+
+    Waiting writers go before new readers so they don't starve, and the
+    readers waiting when a writer releases the lock go before the next
+    writer. Both locks are reentrant, and the writer may also take the
+    read lock.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked lock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting = 0
+        self._generation = 0
+        self._new_readers = 0
+        self._old_readers = 0
+
+    def acquire_read(self):
+        """ Wait until no writer holds or waits for the lock, then share it
+        """
+        me = threading.get_ident()
+        depth = getattr(self._local, 'depth', 0)
+        if depth > 0 or self._writer == me:
+            self._local.depth = depth + 1
+            return
+        with self._cond:
+            generation = self._generation
+            self._new_readers += 1
+            self._cond.wait_for(lambda: self._writer is None and (
+                self._waiting == 0 or self._generation != generation))
+            if self._generation != generation:
+                self._old_readers -= 1
+            else:
+                self._new_readers -= 1
+            self._readers += 1
+        self._local.depth = 1
+
+    def release_read(self):
+        """ Release a shared hold on the lock
+        """
+        self._local.depth -= 1
+        if self._local.depth > 0 or self._writer == threading.get_ident():
+            return
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """ Wait until nobody holds the lock, then hold it alone
+        """
+        me = threading.get_ident()
+        if self._writer == me:
+            self._depth += 1
+            return
+        if getattr(self._local, 'depth', 0) > 0:
+            raise RuntimeError("cannot upgrade a read lock to a write lock")
+        with self._cond:
+            self._waiting += 1
+            self._cond.wait_for(lambda: self._writer is None and
+                                self._readers == 0 and self._old_readers == 0)
+            self._waiting -= 1
+            self._writer, self._depth = (me, 1)
+
+    def release_write(self):
+        """ Release the exclusive hold on the lock
+        """
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        with self._cond:
+            self._writer = None
+            self._generation += 1
+            self._old_readers += self._new_readers
+            self._new_readers = 0
+            self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        """ Hold the lock shared for the duration of a with block
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        """ Hold the lock alone for the duration of a with block
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
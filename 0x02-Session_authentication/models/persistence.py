@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+""" Persistence module
+"""
+from os import getenv, path
+from typing import Dict, Iterator, List, Set, Tuple
+import atexit
+import json
+import os
+import threading
+
+
+JOURNAL_THRESHOLD = int(getenv('MODELS_JOURNAL_THRESHOLD', '1000'))
+FSYNC = getenv('MODELS_FSYNC', 'never')
+
+
+def sync(f):
+    """ Force a written file to disk when the fsync policy asks for it
+    """
+    if FSYNC == 'always':
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SnapshotPersistence():
+    """ Rewrite the file of the shards of a class affected by each change
+    """
+
+    def replay(self, cls) -> Iterator[Tuple[str, str, dict]]:
+        """ Return the changes made since the last snapshot
+        """
+        return iter(())
+
+    def persist(self, cls, saved: List, removed: List[str],
+                changed: Dict[str, Set[str]] = None):
+        """ Write the shards of the saved objects and removed IDs of a class
+        """
+        cls.save_to_file({cls.shard(obj.id) for obj in saved} |
+                         {cls.shard(obj_id) for obj_id in removed})
+
+    def snapshot_written(self, cls):
+        """ Forget the changes included in a new snapshot
+        """
+        pass
+
+    def flush(self):
+        """ Write pending changes, there are none
+        """
+        pass
+
+
+class JournalPersistence():
+    """ Append one record per change to a journal next to the snapshot file,
+    compacting it into the snapshot once it holds too many records
+    """
+
+    def __init__(self, threshold: int = JOURNAL_THRESHOLD):
+        """ Initialize the journal with a compaction threshold
+        """
+        self.threshold = threshold
+        self._sizes = {}
+
+    @staticmethod
+    def journal_path(cls) -> str:
+        """ Return the journal file of a class
+        """
+        return ".db_{}.journal".format(cls.__name__)
+
+    def replay(self, cls) -> Iterator[Tuple[str, str, dict]]:
+        """ Return the (operation, ID, object JSON) records of the journal
+        A torn record left by an interrupted write is cut off the file.
+        """
+        s_class = cls.__name__
+        self._sizes[s_class] = 0
+        file_path = self.journal_path(cls)
+        if not path.exists(file_path):
+            return
+        with open(file_path, 'r+b') as f:
+            offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("torn record")
+                    record = json.loads(line)
+                except ValueError:
+                    f.truncate(offset)
+                    break
+                offset += len(line)
+                self._sizes[s_class] += 1
+                yield record['op'], record['id'], record.get('obj')
+
+    def persist(self, cls, saved: List, removed: List[str],
+                changed: Dict[str, Set[str]] = None):
+        """ Append saved objects and removed IDs of a class to the journal,
+        only the changed attributes of the objects in changed by ID
+        """
+        s_class = cls.__name__
+        changed = {} if changed is None else changed
+        lines = []
+        for obj in saved:
+            obj_json = obj.to_json(True)
+            if changed.get(obj.id) is None:
+                record = {'op': 'save', 'id': obj.id, 'obj': obj_json}
+            else:
+                record = {'op': 'update', 'id': obj.id, 'obj': {
+                    k: obj_json[k] for k in changed[obj.id] if k in obj_json
+                }}
+            lines.append(json.dumps(record))
+        lines.extend(json.dumps({'op': 'remove', 'id': obj_id})
+                     for obj_id in removed)
+        with open(self.journal_path(cls), 'a') as f:
+            f.write(''.join(line + '\n' for line in lines))
+            sync(f)
+        self._sizes[s_class] = self._sizes.get(s_class, 0) + len(lines)
+        if self._sizes[s_class] >= self.threshold:
+            cls.save_to_file()
+
+    def snapshot_written(self, cls):
+        """ Empty the journal once its records are in the snapshot
+        """
+        file_path = self.journal_path(cls)
+        if path.exists(file_path):
+            os.remove(file_path)
+        self._sizes[cls.__name__] = 0
+
+    def flush(self):
+        """ Write pending changes, there are none
+        """
+        pass
+
+
+class WriteBehindPersistence():
+    """ Collect changes in memory and hand them to another persistence
+    in one batch every interval seconds or max_pending changes
+    """
+
+    def __init__(self, persistence, interval: float = 1.0,
+                 max_pending: int = 1000):
+        """ Initialize the buffer and start its background flusher
+        """
+        self.persistence = persistence
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._count = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+        atexit.register(self.flush)
+
+    def replay(self, cls) -> Iterator[Tuple[str, str, dict]]:
+        """ Return the changes made since the last snapshot
+        """
+        return self.persistence.replay(cls)
+
+    def persist(self, cls, saved: List, removed: List[str],
+                changed: Dict[str, Set[str]] = None):
+        """ Record saved objects and removed IDs until the next flush,
+        merging the changed attributes of objects saved several times
+        """
+        changed = {} if changed is None else changed
+        with self._cond:
+            changes = self._pending.setdefault(cls, {})
+            for obj in saved:
+                fields = changed.get(obj.id)
+                pending, pending_fields = changes.get(obj.id, (obj, set()))
+                if pending is None or pending_fields is None or \
+                        fields is None:
+                    changes[obj.id] = (obj, None)
+                else:
+                    changes[obj.id] = (obj, pending_fields | fields)
+            for obj_id in removed:
+                changes[obj_id] = (None, None)
+            self._count += len(saved) + len(removed)
+            if self._count >= self.max_pending:
+                self._cond.notify()
+
+    def snapshot_written(self, cls):
+        """ Forget the changes included in a new snapshot
+        """
+        self.persistence.snapshot_written(cls)
+
+    def flush(self):
+        """ Write all pending changes, one batch per class
+        """
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending, self._count = (self._pending, {}, 0)
+            for cls, changes in pending.items():
+                saved = [obj for obj, _ in changes.values() if obj is not None]
+                removed = [i for i, (obj, _) in changes.items() if obj is None]
+                changed = {i: fields for i, (obj, fields) in changes.items()
+                           if obj is not None and fields is not None}
+                with cls.lock().writing():
+                    self.persistence.persist(cls, saved, removed, changed)
+
+    def _run(self):
+        """ Flush pending changes forever
+        """
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._count >= self.max_pending, self.interval)
+            self.flush()
+
+
+PERSISTENCES = {
+    'snapshot': SnapshotPersistence,
+    'journal': JournalPersistence,
+}
+
+
+def make_persistence():
+    """ Build the persistence configured by the environment
+    """
+    persistence = PERSISTENCES[getenv('MODELS_PERSISTENCE', 'snapshot')]()
+    if getenv('MODELS_WRITE_BEHIND', '0') == '1':
+        persistence = WriteBehindPersistence(
+            persistence,
+            float(getenv('MODELS_WRITE_BEHIND_INTERVAL', '1.0')),
+            int(getenv('MODELS_WRITE_BEHIND_MAX_PENDING', '1000')),
+        )
+    return persistence
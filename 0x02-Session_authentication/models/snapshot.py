@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Snapshot module
+"""
+from typing import BinaryIO, Iterable, Iterator, Tuple
+import json
+import pickle
+import struct
+
+
+class JsonSnapshot():
+    """ Snapshot as one JSON object of serialized objects by ID
+    """
+
+    extension = 'json'
+    indexable = False
+
+    def dump(self, objs: Iterable, f: BinaryIO):
+        """ Write objects to a snapshot file
+        """
+        objs_json = {obj.id: obj.to_json(True) for obj in objs}
+        f.write(json.dumps(objs_json).encode('utf-8'))
+
+    def load(self, f: BinaryIO) -> Iterator[Tuple[str, dict]]:
+        """ Return the (ID, attributes) pairs of a snapshot file
+        """
+        return iter(json.load(f).items())
+
+
+class BinarySnapshot():
+    """ Snapshot as pickled records, with timestamps stored as integer
+    seconds since the epoch. Each record is prefixed by its length and
+    by its object ID so the file can be indexed without unpickling it.
+    """
+
+    extension = 'bin'
+    indexable = True
+    MAGIC = b'HBTNSNAP2\n'
+    HEADER = struct.Struct('<IH')
+
+    def dump(self, objs: Iterable, f: BinaryIO):
+        """ Write objects to a snapshot file
+        """
+        pack, dumps = (self.HEADER.pack, pickle.dumps)
+        f.write(self.MAGIC)
+        chunk = []
+        for obj in objs:
+            obj_id = obj.id.encode('utf-8')
+            data = dumps(obj.to_record(), 5)
+            chunk.append(pack(len(data), len(obj_id)))
+            chunk.append(obj_id)
+            chunk.append(data)
+            if len(chunk) >= 30000:
+                f.write(b''.join(chunk))
+                chunk = []
+        f.write(b''.join(chunk))
+
+    def records(self, data) -> Iterator[Tuple[str, int, int]]:
+        """ Return the (ID, offset, length) of the pickled record of each
+        object in snapshot data
+        """
+        if data[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError("not a binary snapshot")
+        unpack_from, size = (self.HEADER.unpack_from, self.HEADER.size)
+        offset, end = (len(self.MAGIC), len(data))
+        while offset < end:
+            length, id_length = unpack_from(data, offset)
+            offset += size
+            obj_id = data[offset:offset + id_length].decode('utf-8')
+            offset += id_length
+            yield obj_id, offset, length
+            offset += length
+
+    def load(self, f: BinaryIO) -> Iterator[Tuple[str, dict]]:
+        """ Return the (ID, attributes) pairs of a snapshot file
+        """
+        data = f.read()
+        loads = pickle.loads
+        for obj_id, offset, length in self.records(data):
+            yield obj_id, loads(data[offset:offset + length])
+
+
+SNAPSHOT_FORMATS = {
+    'json': JsonSnapshot,
+    'binary': BinarySnapshot,
+}
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+from os import getenv
+from typing import Iterable, List, Set
+from models.persistence import FSYNC
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStorage():
+    """ Store the objects of each class in a table of a SQLite database,
+    shared by all the processes opening the same file
+
+    Each thread has its own connection, in WAL mode so that readers don't
+    wait for writers. Statements are built once per class and query shape,
+    and prepared once per connection by the statement cache of sqlite3.
+    """
+
+    def __init__(self, file_path: str = '.db.sqlite3'):
+        """ Initialize the storage of a database file
+        """
+        self.file_path = file_path
+        self._local = threading.local()
+        self._tables = set()
+        self._statements = {}
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread and process
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.file_path, timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous={}".format(
+                'FULL' if FSYNC == 'always' else 'NORMAL'))
+            self._local.conn, self._local.pid = (conn, os.getpid())
+        return conn
+
+    def table(self, cls) -> str:
+        """ Return the table of a class, created with one column per
+        attribute and one index per indexed attribute on first use
+        """
+        name = cls.__name__
+        if name not in self._tables:
+            conn = self.connection()
+            columns = ', '.join(
+                '"{}" TEXT PRIMARY KEY'.format(c) if c == 'id'
+                else '"{}"'.format(c) for c in cls.slots()
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS "{}" ({})'.format(
+                name, columns))
+            for attr in cls.indexed_attributes:
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ("{1}")'
+                    .format(name, attr))
+            self._tables.add(name)
+        return name
+
+    def statement(self, cls, kind: str, *args) -> str:
+        """ Return the SQL of a kind of statement on the table of a class
+        """
+        key = (cls.__name__, kind) + args
+        if key not in self._statements:
+            table = self.table(cls)
+            columns = ', '.join('"{}"'.format(c) for c in cls.slots())
+            if kind == 'select':
+                where = ' AND '.join(args)
+                sql = 'SELECT {} FROM "{}"{}'.format(
+                    columns, table, ' WHERE ' + where if where else '')
+            elif kind == 'range':
+                attr, low, high = args
+                sql = 'SELECT {} FROM "{}" WHERE "{}" IS NOT NULL{}{} ' \
+                    'ORDER BY "{}", "id"'.format(
+                        columns, table, attr,
+                        ' AND "{}" >= ?'.format(attr) if low else '',
+                        ' AND "{}" <= ?'.format(attr) if high else '', attr)
+            elif kind == 'page':
+                attr, after = args
+                sql = 'SELECT {} FROM "{}" WHERE "{}" IS NOT NULL{} ' \
+                    'ORDER BY "{}", "id" LIMIT ?'.format(
+                        columns, table, attr,
+                        ' AND "{0}" >= ? AND ("{0}" > ? OR "id" > ?)'.format(
+                            attr) if after else '', attr)
+            elif kind == 'save':
+                sql = 'INSERT INTO "{}" ({}) VALUES ({}) ON CONFLICT ("id") ' \
+                    'DO UPDATE SET {}'.format(
+                        table, columns, ', '.join('?' for _ in cls.slots()),
+                        ', '.join('"{0}" = excluded."{0}"'.format(c)
+                                  for c in cls.slots() if c != 'id'))
+            elif kind == 'update':
+                sql = 'UPDATE "{}" SET {} WHERE "id" = ?'.format(
+                    table, ', '.join('"{}" = ?'.format(c) for c in args))
+            elif kind == 'remove':
+                sql = 'DELETE FROM "{}" WHERE "id" = ?'.format(table)
+            elif kind == 'count':
+                sql = 'SELECT COUNT(*) FROM "{}"'.format(table)
+            self._statements[key] = sql
+        return self._statements[key]
+
+    def select(self, cls, sql: str, params: List) -> List:
+        """ Return the objects of the rows selected by a statement
+        """
+        columns = cls.slots()
+        rows = self.connection().execute(sql, params)
+        return [cls.from_stored(dict(zip(columns, row))) for row in rows]
+
+    def get(self, cls, obj_id: str):
+        """ Return one object by ID
+        """
+        objs = self.select(cls, self.statement(cls, 'select', '"id" = ?'),
+                           [obj_id])
+        return objs[0] if len(objs) > 0 else None
+
+    def search(self, cls, attributes: dict) -> List:
+        """ Return the objects with matching attributes, compared in SQL
+        for the attributes stored in columns
+        """
+        columns = set(cls.slots())
+        clauses, params, others = ([], [], {})
+        for k, v in attributes.items():
+            if k not in columns:
+                others[k] = v
+            elif v is None:
+                clauses.append('"{}" IS NULL'.format(k))
+            else:
+                clauses.append('"{}" = ?'.format(k))
+                params.append(cls.to_record_value(k, v))
+        objs = self.select(cls, self.statement(cls, 'select', *clauses),
+                           params)
+        return [obj for obj in objs
+                if all(getattr(obj, k) == v for k, v in others.items())]
+
+    def search_range(self, cls, attribute: str, low=None, high=None) -> List:
+        """ Return the objects with low <= attribute <= high, ordered by
+        the attribute
+        """
+        params = [cls.to_record_value(attribute, v)
+                  for v in (low, high) if v is not None]
+        sql = self.statement(cls, 'range', attribute,
+                             low is not None, high is not None)
+        return self.select(cls, sql, params)
+
+    def page(self, cls, attribute: str, after=None, limit: int = 100) -> List:
+        """ Return up to limit objects ordered by (attribute, ID), after
+        a (value, ID) key
+        """
+        params = [limit]
+        if after is not None:
+            value = cls.to_record_value(attribute, after[0])
+            params = [value, value, after[1], limit]
+        sql = self.statement(cls, 'page', attribute, after is not None)
+        return self.select(cls, sql, params)
+
+    def count(self, cls) -> int:
+        """ Count the objects of a class
+        """
+        sql = self.statement(cls, 'count')
+        return self.connection().execute(sql).fetchone()[0]
+
+    def save(self, cls, obj, changes: Set[str] = None):
+        """ Insert or update an object, only its changed attributes when
+        they are given and its row still exists
+        """
+        record = obj.to_record()
+        if changes is not None:
+            columns = tuple(sorted(changes))
+            cursor = self.connection().execute(
+                self.statement(cls, 'update', *columns),
+                [record.get(c) for c in columns] + [obj.id])
+            if cursor.rowcount > 0:
+                return
+        self.connection().execute(self.statement(cls, 'save'),
+                                  [record.get(c) for c in cls.slots()])
+
+    def save_all(self, cls, objs: Iterable):
+        """ Insert or update whole objects in one transaction
+        """
+        columns = cls.slots()
+        conn = self.connection()
+        conn.execute('BEGIN')
+        with conn:
+            conn.executemany(self.statement(cls, 'save'), (
+                [record.get(c) for c in columns]
+                for record in (obj.to_record() for obj in objs)))
+
+    def remove(self, cls, obj_id: str):
+        """ Delete an object by ID
+        """
+        self.connection().execute(self.statement(cls, 'remove'), [obj_id])
+
+
+STORAGES = {
+    'sqlite': SQLiteStorage,
+}
+
+
+def make_storage():
+    """ Build the storage configured by the environment, None for the
+    in-memory objects persisted to files
+    """
+    storage = getenv('MODELS_STORAGE', 'file')
+    if storage == 'file':
+        return None
+    return STORAGES[storage](getenv('MODELS_SQLITE_PATH', '.db.sqlite3'))
@@ -9,6 +9,14 @@ class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    indexed_attributes = {
+        'email': 'hash',
+        'first_name': 'hash',
+        'last_name': 'hash',
+        'created_at': 'sorted',
+    }
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+""" Version module
+"""
+from typing import Any, List, Mapping, Set
+import heapq
+
+
+class Version():
+    """ Objects of a class by ID as published to readers: a base mapping
+    and the changes made since, neither modified once published
+
+    Writers derive a new version from the current one for each change
+    instead of modifying it, so readers iterate a version without
+    locking. Published objects are read-only, so versions share them.
+    The indexes of the base are shared by the versions derived from it,
+    and lookups apply the changes to what they find.
+    """
+
+    __slots__ = ('base', 'changes', 'size', 'indexes')
+
+    def __init__(self, base: Mapping, changes: dict = None,
+                 size: int = None, indexes: dict = None):
+        """ Initialize a version from a base mapping, changes by ID, None
+        marking a removed object, and the indexes of the base by
+        attribute, filled in once when they are built later
+        """
+        self.base = base
+        self.changes = {} if changes is None else changes
+        self.size = len(base) if size is None else size
+        self.indexes = {} if indexes is None else indexes
+
+    def get(self, obj_id: str, default=None):
+        """ Return an object by ID
+        """
+        if obj_id in self.changes:
+            obj = self.changes[obj_id]
+            return default if obj is None else obj
+        return self.base.get(obj_id, default)
+
+    def __contains__(self, obj_id) -> bool:
+        """ Check for an object by ID
+        """
+        return self.get(obj_id) is not None
+
+    def __len__(self) -> int:
+        """ Return the number of objects
+        """
+        return self.size
+
+    def values(self) -> List:
+        """ Return the objects
+        """
+        base, changes = (self.base, self.changes)
+        if type(base) is dict and len(changes) == 0:
+            return list(base.values())
+        if type(base) is dict:
+            objs = [obj for obj_id, obj in base.items()
+                    if obj_id not in changes]
+        else:
+            objs = [base.get(obj_id) for obj_id in base
+                    if obj_id not in changes]
+        objs.extend(changes.values())
+        return [obj for obj in objs if obj is not None]
+
+    def saved(self, obj) -> 'Version':
+        """ Return the version with an object saved
+        """
+        if self.get(obj.id) is obj:
+            return self
+        changes = dict(self.changes)
+        changes[obj.id] = obj
+        size = self.size if obj.id in self else self.size + 1
+        return Version(self.base, changes, size, self.indexes)
+
+    def removed(self, obj_id: str) -> 'Version':
+        """ Return the version with an object removed
+        """
+        if obj_id not in self:
+            return self
+        changes = dict(self.changes)
+        changes[obj_id] = None
+        return Version(self.base, changes, self.size - 1, self.indexes)
+
+    def merged(self, base: Mapping) -> 'Version':
+        """ Return the version of a base mapping holding the changes of
+        this one, with copies of the indexes updated with the changes
+        """
+        removed = list(self.changes)
+        saved = [obj for obj in self.changes.values() if obj is not None]
+        indexes = {
+            attr: index.updated(((obj.id, getattr(obj, attr))
+                                 for obj in saved), removed)
+            for attr, index in list(self.indexes.items())
+        }
+        return Version(base, None, None, indexes)
+
+    def _changed(self, attribute: str, after=None, low=None,
+                 high=None) -> List[tuple]:
+        """ Return the (value, ID) of the attribute of the objects saved
+        since the base with low <= value <= high, or after a (value, ID)
+        key, leaving out the values which can't be compared
+        """
+        keys = []
+        for obj_id, obj in self.changes.items():
+            value = None if obj is None else getattr(obj, attribute)
+            if value is None:
+                continue
+            try:
+                if (low is None or low <= value) and \
+                        (high is None or value <= high) and \
+                        (after is None or (value, obj_id) > after):
+                    keys.append((value, obj_id))
+            except TypeError:
+                continue
+        return keys
+
+    def count(self, attribute: str, value: Any) -> int:
+        """ Return an upper bound of the number of IDs lookup returns
+        """
+        return self.indexes[attribute].count(value) + len(self.changes)
+
+    def lookup(self, attribute: str, value: Any) -> Set[str]:
+        """ Return the IDs of the objects holding a value of an indexed
+        attribute
+        """
+        ids = self.indexes[attribute].lookup(value)
+        if len(self.changes) == 0:
+            return ids
+        ids.difference_update(self.changes)
+        ids.update(obj_id for obj_id, obj in self.changes.items()
+                   if obj is not None and getattr(obj, attribute) == value)
+        return ids
+
+    def _merge(self, index, ids: List[str],
+               changed: List[tuple]) -> List[str]:
+        """ Return the IDs found in a sorted index which didn't change,
+        merged with the (value, ID) keys of changed objects in order
+        """
+        kept = [(index.value(obj_id), obj_id) for obj_id in ids
+                if obj_id not in self.changes]
+        try:
+            changed.sort()
+            return [obj_id for _, obj_id in heapq.merge(kept, changed)]
+        except TypeError:
+            return [obj_id for _, obj_id in kept + changed]
+
+    def range(self, attribute: str, low: Any = None,
+              high: Any = None) -> List[str]:
+        """ Return the IDs with low <= attribute <= high from a sorted
+        index, in (value, ID) order when the values can be compared
+        """
+        index = self.indexes[attribute]
+        ids = index.range(low, high)
+        if len(self.changes) == 0:
+            return ids
+        return self._merge(index, ids,
+                           self._changed(attribute, low=low, high=high))
+
+    def after(self, attribute: str, value: Any, obj_id: str,
+              limit: int) -> List[str]:
+        """ Return up to limit IDs after (value, obj_id) in (value, ID)
+        order from a sorted index, from the first one when value is None
+        """
+        index = self.indexes[attribute]
+        ids = index.after(value, obj_id, limit + len(self.changes))
+        if len(self.changes) == 0:
+            return ids
+        after = None if value is None else (value, obj_id)
+        return self._merge(index, ids,
+                           self._changed(attribute, after=after))[:limit]
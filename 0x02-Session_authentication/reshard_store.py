@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+""" Change the number of shard files of the User file store
+Usage: ./reshard_store.py <current shards> <new shards>
+Set MODELS_SHARDS to the new number of shards afterwards.
+"""
+import os
+import sys
+from models import base
+from models.user import User
+
+
+def reshard(current: int, new: int):
+    """ Load the User store from some shards and write it in others
+    """
+    base.SHARDS = current
+    User.load_from_file()
+    old_paths = User.file_paths()
+    base.SHARDS = new
+    User.save_to_file()
+    for file_path in set(old_paths) - set(User.file_paths()):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    print("{} users written to {}".format(
+        User.count(), ', '.join(User.file_paths())))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or not all(a.isdigit() and int(a) > 0
+                                     for a in sys.argv[1:]):
+        print(__doc__.strip())
+        sys.exit(1)
+    reshard(int(sys.argv[1]), int(sys.argv[2]))